@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import AsyncGenerator, AsyncIterator, Optional, TextIO
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (if it exists), as main.py does
+load_dotenv(dotenv_path="../.env")
+
+import config
+from engine_base import EngineBackend, get_engine
+from harmony_stream import HarmonyControl
+from metrics import RequestTrace
+from routers import chat
+from routers.chat import HarmonySampleBuilder, conversation_key, parse_reasoning_effort, prepare_prompt, reasoning_budget, with_system_message
+from routers.common import SampleBuilder, collect_samples, request_timeout, sampling_params
+from context_budget import STRATEGIES
+from scheduler import AdmissionRejected, Slot
+
+# ------------------------------------------------------------------------------
+# Offline Batch Inference
+# ------------------------------------------------------------------------------
+#
+# A batch job is a JSONL stream of requests, one per line:
+#
+#     {"id": "q1", "prompt": "Once upon a time", "max_tokens": 64}
+#     {"id": "q2", "messages": [{"role": "user", "content": "Hi"}], "reasoning_effort": "low"}
+#
+# Lines with "messages" are chat requests, lines with "prompt" are completions;
+# both accept the sampling parameters of /chat and /completion (including n and
+# best_of; their results then list every sample under "samples"). Requests are
+# submitted concurrently (up to a cap) so continuous batching keeps the GPU busy,
+# and results are produced in completion order, tagged with the request's "id"
+# (its line number if it has none). Run a job over HTTP (POST /batch) or with:
+#
+#     python batch.py requests.jsonl -o results.jsonl --checkpoint job.done
+
+
+class BatchCheckpoint:
+    """
+    IDs of a job's finished requests, appended to a file as results are delivered.
+    Rerunning the job with the same checkpoint skips them; failed requests are retried.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._done = {line.rstrip("\n") for line in f if line.strip()}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _key(request_id) -> str:
+        # IDs are stored JSON-encoded, so "1" and 1 stay distinct and IDs can't span lines
+        return json.dumps(request_id)
+
+    def __contains__(self, request_id) -> bool:
+        return self._key(request_id) in self._done
+
+    def add(self, request_id):
+        key = self._key(request_id)
+        self._done.add(key)
+        self._file.write(key + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+async def _acquire(engine: EngineBackend, background: bool) -> Slot:
+    """Waits for an engine slot without a queue deadline, retrying while the queue is full."""
+    while True:
+        try:
+            return await engine.scheduler.acquire(background=background)
+        except AdmissionRejected as e:
+            await asyncio.sleep(e.retry_after)
+
+
+async def run_request(engine: EngineBackend, item: dict, request_id, background: bool) -> dict:
+    """
+    Runs one batch request to completion.
+
+    Returns:
+        dict: {"id", "status": "ok", "finish_reason", "usage", ...} with "text" for
+        completions or "content" and "reasoning" for chat requests (a "samples"
+        list of them if the request set n > 1), or {"id", "status": "error", "error"}
+        if the request failed.
+    """
+    trace = RequestTrace("/batch")
+    try:
+        params, n = sampling_params({**item, "stream": False})
+        timeout = request_timeout(item)
+        affinity_key = None
+        control = None
+
+        if "messages" in item:
+            # Chat: render the Harmony prompt before taking a slot
+            if chat.enc is None:
+                raise RuntimeError("Harmony encoding not initialized")
+            raw_messages = item["messages"]
+            if not raw_messages or not isinstance(raw_messages, list):
+                raise ValueError("messages must be a non-empty list")
+            reasoning_effort = parse_reasoning_effort(item.get("reasoning_effort", config.DEFAULT_REASONING_EFFORT))
+            strategy = item.get("context_strategy", config.CONTEXT_STRATEGY)
+            if strategy not in STRATEGIES:
+                raise ValueError(f"context_strategy must be one of {list(STRATEGIES)}")
+            trace.reasoning_effort = reasoning_effort.value.lower()
+            trace.mark("parse")
+            raw_messages = with_system_message(raw_messages)
+            fitted = await prepare_prompt(
+                raw_messages,
+                reasoning_effort,
+                reserve_tokens=params["max_tokens"],
+                strategy=strategy,
+                trace=trace,
+            )
+            prompt = fitted.token_ids
+            params["detokenize"] = False
+            params["stop_token_ids"] = chat.STOP_TOKEN_IDS
+            affinity_key = conversation_key(raw_messages)
+            control = HarmonyControl(chat.enc, reasoning_budget(item, reasoning_effort, params["max_tokens"]))
+            new_sample = HarmonySampleBuilder
+        elif item.get("prompt"):
+            trace.mark("parse")
+            prompt = item["prompt"]
+            new_sample = SampleBuilder
+        else:
+            raise ValueError("Each request needs a 'prompt' or 'messages'")
+
+        slot = await _acquire(engine, background)
+        outputs = engine.generate(prompt, slot=slot, timeout=timeout, trace=trace, affinity_key=affinity_key, control=control, **params)
+        response = await collect_samples(outputs, n, new_sample)
+        result = {"id": request_id, "status": "ok", "finish_reason": response.get("finish_reason"), "usage": response["usage"]}
+        if n > 1:
+            result["samples"] = response["samples"]
+        elif response["samples"]:
+            sample = response["samples"][0]
+            result.update({k: v for k, v in sample.items() if k not in ("index", "finish_reason", "completion_tokens")})
+        return result
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e)
+        return {"id": request_id, "status": "error", "error": detail}
+
+
+async def run_batch(
+    lines: AsyncIterator[str],
+    concurrency: int = config.BATCH_CONCURRENCY,
+    background: bool = config.BATCH_LOW_PRIORITY,
+    checkpoint: Optional[BatchCheckpoint] = None,
+) -> AsyncGenerator[dict, None]:
+    """
+    Runs every request in a JSONL stream and yields the results as they finish.
+
+    Input is read lazily: at most `concurrency` requests are running or waiting
+    to be delivered at any time. A result is recorded in the checkpoint once the
+    consumer has taken it. The last item is {"summary": {...}} with job counts.
+
+    Args:
+        lines (AsyncIterator[str]): JSONL request lines.
+        concurrency (int): Max requests of this job in flight.
+        background (bool): Queue behind interactive requests (low-priority mode).
+        checkpoint (BatchCheckpoint | None): Skips requests that finished in an earlier run.
+    """
+    engine = get_engine()
+    results: asyncio.Queue = asyncio.Queue()
+    # Held from submission until the result has been consumed, so a slow reader
+    # stops the job instead of letting results pile up
+    capacity = asyncio.Semaphore(max(1, concurrency))
+    tasks = set()
+    summary = {"submitted": 0, "succeeded": 0, "failed": 0, "skipped": 0}
+
+    async def run_one(item: dict, request_id):
+        results.put_nowait(await run_request(engine, item, request_id, background))
+
+    async def submit():
+        index = 0
+        try:
+            async for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                request_id = index
+                index += 1
+                try:
+                    item = json.loads(line)
+                    if not isinstance(item, dict):
+                        raise ValueError("not a JSON object")
+                except ValueError as e:
+                    await capacity.acquire()
+                    results.put_nowait({"id": request_id, "status": "error", "error": f"Invalid request line: {e}"})
+                    continue
+                request_id = item.get("id", request_id)
+                if checkpoint is not None and request_id in checkpoint:
+                    summary["skipped"] += 1
+                    continue
+                await capacity.acquire()
+                summary["submitted"] += 1
+                task = asyncio.create_task(run_one(item, request_id))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except Exception as e:
+            await capacity.acquire()
+            results.put_nowait({"id": None, "status": "error", "error": f"Failed to read requests: {e}"})
+        if tasks:
+            await asyncio.wait(list(tasks))
+        # End of job
+        results.put_nowait(None)
+
+    producer = asyncio.create_task(submit())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            summary["succeeded" if result["status"] == "ok" else "failed"] += 1
+            yield result
+            if checkpoint is not None and result["status"] == "ok":
+                checkpoint.add(result["id"])
+            capacity.release()
+        yield {"summary": summary}
+    finally:
+        # The consumer went away (e.g. client disconnect): abort everything still running,
+        # and wait for it to stop, so the caller can close the input and the checkpoint
+        running = [producer, *tasks]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def _read_lines(file: TextIO) -> AsyncIterator[str]:
+    """Reads a (possibly slow, e.g. piped) file without blocking the event loop."""
+    while True:
+        line = await asyncio.to_thread(file.readline)
+        if not line:
+            return
+        yield line
+
+
+async def main(args: argparse.Namespace):
+    engine = get_engine()
+    engine.initialize()
+    chat.load_harmony()
+    checkpoint = BatchCheckpoint(args.checkpoint) if args.checkpoint else None
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    # Resumed jobs append to the results of earlier runs
+    output = open(args.output, "a" if checkpoint else "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for result in run_batch(_read_lines(source), args.concurrency, not args.no_low_priority, checkpoint):
+            if "summary" in result:
+                print(f"✅ Batch finished: {result['summary']}", file=sys.stderr)
+                continue
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat/completion requests through the engine.")
+    parser.add_argument("input", help="JSONL requests ('-' reads standard input)")
+    parser.add_argument("-o", "--output", help="Where to write JSONL results (default: standard output)")
+    parser.add_argument("--checkpoint", help="File of finished request IDs; rerun with the same file to resume")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY, help="Max requests in flight")
+    parser.add_argument("--no-low-priority", action="store_true", help="Don't yield engine slots to interactive requests")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import sys
+from benchmarks.cases import BENCHMARKS
+from benchmarks.harness import Skip, find_regressions, format_results, load_baseline, measure, save_baseline
+
+# ------------------------------------------------------------------------------
+# CPU Hot-Path Benchmarks
+# ------------------------------------------------------------------------------
+#
+# Run from backend/ (no GPU or vLLM needed):
+#
+#     python -m benchmarks --save baseline.json                  # record a baseline
+#     python -m benchmarks --compare baseline.json --threshold 0.15
+#
+# With --compare, the exit status is 1 if any benchmark got slower or allocates
+# more than the threshold allows, or if a benchmark in the baseline didn't run
+# (e.g. skipped because the Harmony vocab is unavailable), so the suite can gate CI. Baselines are
+# machine-specific: record them on the machine that runs the comparison.
+
+
+def _selected(name: str, args: argparse.Namespace) -> bool:
+    return not args.only or any(pattern in name for pattern in args.only)
+
+
+async def main(args: argparse.Namespace) -> int:
+    baseline = load_baseline(args.compare) if args.compare else None
+    if baseline is not None:
+        # Every selected baseline benchmark must run, or the comparison proves nothing
+        baseline = {name: base for name, base in baseline.items() if _selected(name, args)}
+    results = []
+    for benchmark in BENCHMARKS:
+        if not _selected(benchmark.name, args):
+            continue
+        print(f"🔄 {benchmark.name}: {benchmark.description}", file=sys.stderr)
+        try:
+            results.append(await measure(benchmark, args.repeat))
+        except Skip as e:
+            print(f"ℹ️  Skipped {benchmark.name}: {e}", file=sys.stderr)
+
+    print(format_results(results, baseline))
+    if args.save:
+        save_baseline(args.save, results)
+        print(f"✅ Baseline saved to {args.save}", file=sys.stderr)
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"⚠️  Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"✅ No regressions beyond {args.threshold:.0%}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the per-token CPU paths of the API.")
+    parser.add_argument("--only", nargs="+", help="Run only benchmarks whose name contains one of these strings")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (the fastest counts)")
+    parser.add_argument("--save", help="Write the results to this baseline file")
+    parser.add_argument("--compare", help="Compare against this baseline file and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown or allocation growth (0.15 = 15%%)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
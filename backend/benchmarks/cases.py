@@ -0,0 +1,249 @@
+import asyncio
+import random
+from typing import AsyncIterator, List, Optional, Union
+import config
+from benchmarks.harness import Benchmark, Skip, Workload
+from engine_base import EngineBackend, EngineOutput, SamplingConfig
+from metrics import RequestTrace
+from scheduler import AdmissionScheduler
+
+# ------------------------------------------------------------------------------
+# Benchmark Workloads
+# ------------------------------------------------------------------------------
+#
+# Synthetic, seeded workloads for the CPU-side hot paths of a request. No model
+# is loaded: engine output is replayed from prepared token lists, or produced by
+# the simulated engine with its latencies set to zero.
+
+_WORDS = (
+    "the model weighs each option carefully before writing a short answer that "
+    "covers edge cases numbers like 42 and 3.14 unicode such as café naïve and "
+    "punctuation: commas, quotes \"like this\" and new\nlines"
+).split(" ")
+
+REASONING_TOKENS = 8000   # Analysis channel length of the long reasoning trace
+HISTORY_TURNS = 100       # User/assistant turn pairs in the long history
+STREAMS = 1000            # Concurrent simulated streams
+STREAM_TOKENS = 64        # Tokens per simulated stream
+DELTA_OUTPUTS = 50_000    # Single-token deltas in the engine stream benchmark
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _harmony():
+    """The Harmony encoding and the chat router's helpers, or Skip if the vocab can't be loaded."""
+    from routers import chat
+    if chat.load_harmony() is None:
+        raise Skip("Harmony encoding unavailable")
+    return chat
+
+
+def _chunked(token_ids: List[int], rng: random.Random, max_chunk: int) -> List[EngineOutput]:
+    """Splits a response into engine outputs of 1..max_chunk tokens, like a decode stream."""
+    outputs = []
+    i = 0
+    while i < len(token_ids):
+        size = rng.randint(1, max_chunk)
+        outputs.append(EngineOutput(text="", token_ids=token_ids[i:i + size]))
+        i += size
+    outputs[-1].finish_reason = "stop"
+    outputs[0].prompt_tokens = 0
+    return outputs
+
+
+async def _replay(outputs: List[EngineOutput]) -> AsyncIterator[EngineOutput]:
+    for output in outputs:
+        yield output
+
+
+def _filter_workload(text: str, max_chunk: int) -> Workload:
+    chat = _harmony()
+    token_ids = chat.enc.encode(text, allowed_special="all")
+    outputs = _chunked(token_ids, random.Random(1), max_chunk)
+
+    async def run():
+        async for _ in chat.filter_harmony_stream(_replay(outputs)):
+            pass
+
+    return Workload(run, len(token_ids))
+
+
+def long_reasoning() -> Workload:
+    """An 8k-token analysis message followed by a short final answer."""
+    rng = random.Random(0)
+    text = (
+        f"<|channel|>analysis<|message|>{_text(rng, REASONING_TOKENS)}"
+        f"<|end|><|start|>assistant<|channel|>final<|message|>{_text(rng, 300)}"
+    )
+    return _filter_workload(text, max_chunk=8)
+
+
+def split_markers() -> Workload:
+    """Hundreds of short messages in 1-3 token chunks, so channel headers span outputs."""
+    rng = random.Random(0)
+    parts = []
+    for i in range(300):
+        channel = ("analysis", "commentary", "final")[i % 3]
+        recipient = " to=functions.lookup" if channel == "commentary" and i % 2 else ""
+        start = "" if i == 0 else "<|start|>assistant"
+        parts.append(f"{start}<|channel|>{channel}{recipient}<|message|>{_text(rng, rng.randint(3, 20))}<|end|>")
+    return _filter_workload("".join(parts), max_chunk=3)
+
+
+def _history(rng: random.Random) -> List[dict]:
+    history = [{"role": "system", "content": "You are a helpful assistant. " + _text(rng, 40)}]
+    for _ in range(HISTORY_TURNS):
+        history.append({"role": "user", "content": _text(rng, rng.randint(10, 80))})
+        history.append({"role": "assistant", "content": _text(rng, rng.randint(30, 200))})
+    return history
+
+
+def _history_tokens(chat, history: List[dict]) -> int:
+    from context_budget import ContextBudgeter
+    from openai_harmony import ReasoningEffort
+    budgeter = ContextBudgeter(chat.enc, chat.build_harmony_messages)
+    return len(budgeter.fit(history, ReasoningEffort.LOW, reserve_tokens=0, max_context_tokens=10**9).token_ids)
+
+
+def build_messages() -> Workload:
+    """Converting a 100-turn history to Harmony messages (per token of the rendered history)."""
+    chat = _harmony()
+    from openai_harmony import ReasoningEffort
+    history = _history(random.Random(0))
+    build = chat.build_harmony_messages
+
+    def run():
+        for raw in history:
+            build(raw["role"], raw["content"], ReasoningEffort.LOW)
+
+    return Workload(run, _history_tokens(chat, history))
+
+
+def _fit_workload(warm: bool) -> Workload:
+    chat = _harmony()
+    from context_budget import ContextBudgeter
+    from openai_harmony import ReasoningEffort
+    history = _history(random.Random(0))
+    budgeter = ContextBudgeter(chat.enc, chat.build_harmony_messages)
+    if warm:
+        budgeter.fit(history, ReasoningEffort.LOW, reserve_tokens=1000, max_context_tokens=8000, strategy="drop_oldest")
+
+    def run():
+        budgeter.fit(history, ReasoningEffort.LOW, reserve_tokens=1000, max_context_tokens=8000, strategy="drop_oldest")
+
+    return Workload(run, _history_tokens(chat, history))
+
+
+def fit_cold() -> Workload:
+    """Rendering and truncating a 100-turn history with an empty render cache (first request)."""
+    return _fit_workload(warm=False)
+
+
+def fit_warm() -> Workload:
+    """The same with every message already cached (each later turn of a conversation)."""
+    return _fit_workload(warm=True)
+
+
+class ReplayEngine(EngineBackend):
+    """An engine backend that replays prepared outputs, so only the shared streaming path is measured."""
+
+    outputs: List[EngineOutput] = []
+
+    @property
+    def is_initialized(self) -> bool:
+        return True
+
+    def initialize(self):
+        pass
+
+    async def _generate(self, prompt: Union[str, List[int]], sampling: SamplingConfig, request_id: str, affinity_key: Optional[str] = None, priority: int = 0, background: bool = False) -> AsyncIterator[EngineOutput]:
+        for output in self.outputs:
+            yield output
+
+
+def engine_deltas() -> Workload:
+    """EngineBackend.generate_stream over 50k single-token deltas (deadline checks, tracing, coalescing, framing)."""
+    rng = random.Random(0)
+    engine = ReplayEngine()
+    engine.outputs = [EngineOutput(text=" " + rng.choice(_WORDS), token_ids=[i]) for i in range(DELTA_OUTPUTS)]
+    engine.outputs[-1].finish_reason = "stop"
+    engine.outputs[0].prompt_tokens = 0
+
+    async def run():
+        slot = await AdmissionScheduler(max_in_flight=1, max_queue=1).acquire()
+        async for _ in engine.generate_stream("benchmark", slot=slot, timeout=config.REQUEST_TIMEOUT, trace=RequestTrace("/completion")):
+            pass
+
+    return Workload(run, DELTA_OUTPUTS)
+
+
+def _simulated_engine():
+    from simulated_engine import SimulatedEngine
+    # Zero latency: the engine produces tokens as fast as the API layer consumes them
+    config.SIM_TTFT = 0
+    config.SIM_TOKEN_LATENCY = 0
+    config.SIM_REASONING_TOKENS = STREAM_TOKENS // 2
+    config.SIM_OUTPUT_TOKENS = STREAM_TOKENS
+    engine = SimulatedEngine()
+    engine.initialize()
+    return engine
+
+
+async def _run_streams(open_stream):
+    """Runs STREAMS streams concurrently, each holding its own admission slot."""
+    scheduler = AdmissionScheduler(max_in_flight=STREAMS, max_queue=STREAMS)
+
+    async def one():
+        slot = await scheduler.acquire()
+        async for _ in open_stream(slot):
+            pass
+
+    await asyncio.gather(*(one() for _ in range(STREAMS)))
+
+
+def simulated_completions() -> Workload:
+    """1k concurrent /completion streams on the simulated engine."""
+    engine = _simulated_engine()
+
+    async def run():
+        await _run_streams(lambda slot: engine.generate_stream(
+            "benchmark prompt", slot=slot, trace=RequestTrace("/completion"), max_tokens=STREAM_TOKENS,
+        ))
+
+    return Workload(run, STREAMS * STREAM_TOKENS)
+
+
+def simulated_chats() -> Workload:
+    """1k concurrent /chat streams on the simulated engine (stop conditions, Harmony parsing, framing)."""
+    chat = _harmony()
+    from harmony_stream import HarmonyControl
+    engine = _simulated_engine()
+    prompt = chat.enc.encode("<|start|>user<|message|>Hello<|end|><|start|>assistant", allowed_special="all")
+
+    def open_stream(slot):
+        trace = RequestTrace("/chat")
+        outputs = engine.generate(
+            prompt, slot=slot, trace=trace, control=HarmonyControl(chat.enc),
+            max_tokens=len(engine._script), detokenize=False, stop_token_ids=chat.STOP_TOKEN_IDS,
+        )
+        return chat.filter_harmony_stream(outputs, trace=trace)
+
+    async def run():
+        await _run_streams(open_stream)
+
+    # Every stream runs the whole script except its closing <|return|>
+    return Workload(run, STREAMS * (len(engine._script) - 1))
+
+
+BENCHMARKS = [
+    Benchmark("harmony_filter_long_reasoning", long_reasoning.__doc__, long_reasoning),
+    Benchmark("harmony_filter_split_markers", split_markers.__doc__, split_markers),
+    Benchmark("harmony_build_messages", build_messages.__doc__, build_messages),
+    Benchmark("context_fit_cold_100_turns", fit_cold.__doc__, fit_cold),
+    Benchmark("context_fit_warm_100_turns", fit_warm.__doc__, fit_warm),
+    Benchmark("engine_delta_stream", engine_deltas.__doc__, engine_deltas),
+    Benchmark("simulated_completion_streams_1k", simulated_completions.__doc__, simulated_completions),
+    Benchmark("simulated_chat_streams_1k", simulated_chats.__doc__, simulated_chats),
+]
@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from metrics import LoopLagMonitor
+
+# ------------------------------------------------------------------------------
+# Benchmark Harness
+# ------------------------------------------------------------------------------
+
+# How often the loop lag probe wakes up during async workloads (seconds)
+LAG_PROBE_INTERVAL = 0.001
+# Allocation peaks this close to the baseline never count as regressions (KiB)
+ALLOC_NOISE_KIB = 64
+
+
+class Skip(Exception):
+    """Raised by a benchmark's setup when it can't run here (e.g. the Harmony vocab is unavailable)."""
+
+
+@dataclass
+class Workload:
+    """
+    One prepared benchmark run.
+
+    `run` does the measured work (a plain or async function, called once per
+    repetition) over `tokens` tokens; everything it needs is built beforehand.
+    """
+    run: Callable[[], Union[None, Awaitable[None]]]
+    tokens: int
+
+
+@dataclass
+class Benchmark:
+    name: str
+    description: str
+    # Builds a fresh Workload (outside the measured time)
+    setup: Callable[[], Workload]
+
+
+@dataclass
+class Result:
+    name: str
+    tokens: int
+    ns_per_token: float
+    # Peak memory allocated by one repetition (tracemalloc)
+    alloc_peak_kib: float
+    # Worst event loop lag during an async workload (None for synchronous ones)
+    loop_lag_ms: Optional[float] = None
+
+
+async def _call(workload: Workload):
+    result = workload.run()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def measure(benchmark: Benchmark, repeat: int) -> Result:
+    """
+    Runs a benchmark `repeat` times (after a warm-up) and keeps the fastest run:
+    noise on a shared machine only ever adds time. Allocations are measured in a
+    separate run, since tracing slows everything down.
+    """
+    workload = benchmark.setup()
+    await _call(workload)
+
+    is_async = inspect.iscoroutinefunction(workload.run)
+    best = float("inf")
+    lag = None
+    for _ in range(max(1, repeat)):
+        workload = benchmark.setup()
+        monitor = LoopLagMonitor(LAG_PROBE_INTERVAL) if is_async else None
+        if monitor is not None:
+            monitor.start()
+            # Let the probe start its first sleep before the workload takes the loop
+            await asyncio.sleep(0)
+        started = time.perf_counter_ns()
+        await _call(workload)
+        elapsed = time.perf_counter_ns() - started
+        if monitor is not None:
+            # The probe only records lag when it wakes up
+            await asyncio.sleep(LAG_PROBE_INTERVAL * 2)
+            monitor.stop()
+            lag = max(lag or 0.0, monitor.take_max() * 1000)
+        best = min(best, elapsed)
+
+    workload = benchmark.setup()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        await _call(workload)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        name=benchmark.name,
+        tokens=workload.tokens,
+        ns_per_token=best / max(1, workload.tokens),
+        alloc_peak_kib=max(0, peak - before) / 1024,
+        loop_lag_ms=lag,
+    )
+
+
+def save_baseline(path: str, results: List[Result]):
+    """Writes results as a baseline for later runs to compare against."""
+    baseline = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "results": {result.name: asdict(result) for result in results},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def load_baseline(path: str) -> Dict[str, dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def find_regressions(results: List[Result], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """
+    Compares results with a baseline.
+
+    A benchmark regresses if its ns/token or its allocation peak grew by more
+    than `threshold` (a fraction, e.g. 0.15 for 15%). Loop lag is reported but not
+    gated: it depends too much on what else the machine is doing. A baseline
+    benchmark without a result (skipped here, or removed) also fails the gate,
+    since it could otherwise hide any regression.
+
+    Returns:
+        List[str]: One message per regression.
+    """
+    measured = {result.name for result in results}
+    regressions = [f"{name}: in the baseline but did not run" for name in baseline if name not in measured]
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        limit = base["ns_per_token"] * (1 + threshold)
+        if result.ns_per_token > limit:
+            regressions.append(f"{result.name}: {result.ns_per_token:,.0f} ns/token vs baseline {base['ns_per_token']:,.0f}")
+        alloc_limit = max(base["alloc_peak_kib"] * (1 + threshold), base["alloc_peak_kib"] + ALLOC_NOISE_KIB)
+        if result.alloc_peak_kib > alloc_limit:
+            regressions.append(f"{result.name}: {result.alloc_peak_kib:,.0f} KiB peak vs baseline {base['alloc_peak_kib']:,.0f}")
+    return regressions
+
+
+def format_results(results: List[Result], baseline: Optional[Dict[str, dict]] = None) -> str:
+    """Renders results as a table (with the change against the baseline, if given)."""
+    header = f"{'benchmark':<34} {'tokens':>9} {'ns/token':>11} {'alloc KiB':>10} {'lag ms':>8}"
+    if baseline is not None:
+        header += f" {'vs base':>8}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        lag = f"{result.loop_lag_ms:.2f}" if result.loop_lag_ms is not None else "-"
+        line = f"{result.name:<34} {result.tokens:>9,} {result.ns_per_token:>11,.1f} {result.alloc_peak_kib:>10,.0f} {lag:>8}"
+        if baseline is not None:
+            base = baseline.get(result.name)
+            change = f"{result.ns_per_token / base['ns_per_token'] - 1:+.1%}" if base else "new"
+            line += f" {change:>8}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,69 @@
+import time
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, List
+
+if TYPE_CHECKING:
+    from engine_base import EngineOutput
+
+# ------------------------------------------------------------------------------
+# Output Coalescing
+# ------------------------------------------------------------------------------
+
+# Average bytes per token, used to size frames when the engine doesn't detokenize
+BYTES_PER_TOKEN = 4
+
+
+def _merge_pending(pending: List["EngineOutput"]) -> List["EngineOutput"]:
+    """Merges buffered deltas into one frame per sample (requests with n > 1 interleave samples)."""
+    if len(pending) == 1:
+        return pending
+    merge = type(pending[0]).merge
+    index = pending[0].index
+    if all(output.index == index for output in pending):
+        return [merge(pending)]
+    samples: Dict[int, List["EngineOutput"]] = {}
+    for output in pending:
+        samples.setdefault(output.index, []).append(output)
+    return [merge(outputs) for outputs in samples.values()]
+
+
+async def coalesce_outputs(outputs: AsyncGenerator["EngineOutput", None], window: float, max_bytes: int) -> AsyncGenerator["EngineOutput", None]:
+    """
+    Batches engine deltas into larger frames.
+
+    The first output is forwarded immediately (so time-to-first-token is unchanged).
+    After that, deltas are buffered and flushed as one merged EngineOutput once
+    `window` seconds have passed since the previous frame, once the buffer reaches
+    `max_bytes`, or when a sample finishes. Each flush yields one frame per sample.
+
+    The window is checked as deltas arrive rather than with a timer: the engine
+    produces a delta every decode step, so a frame is late by at most one step,
+    and the per-token cost stays at a list append and a clock read.
+    """
+    pending: List["EngineOutput"] = []
+    pending_bytes = 0
+    last_flush = None
+
+    try:
+        async for output in outputs:
+            pending.append(output)
+            pending_bytes += len(output.text) or BYTES_PER_TOKEN * len(output.token_ids)
+
+            now = time.monotonic()
+            if (
+                last_flush is None
+                or output.finish_reason is not None
+                or pending_bytes >= max_bytes
+                or now - last_flush >= window
+            ):
+                for frame in _merge_pending(pending):
+                    yield frame
+                pending = []
+                pending_bytes = 0
+                last_flush = now
+
+        if pending:
+            for frame in _merge_pending(pending):
+                yield frame
+    finally:
+        # Close the engine stream right away if the consumer stops early (aborts the request)
+        await outputs.aclose()
@@ -1,5 +1,11 @@
 import os
 
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 # ------------------------------------------------------------------------------
 # Configuration Settings
 # ------------------------------------------------------------------------------
@@ -25,5 +31,131 @@ PORT = int(os.getenv("PORT", 8000))
 DEFAULT_TEMPERATURE = 1
 DEFAULT_TOP_P = 1
 DEFAULT_MAX_TOKENS = 1000
-MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", 2000))
+# Total context window (prompt + max_tokens), counted with the Harmony tokenizer
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", 3000))
+# How chat history is truncated: "drop_oldest", "keep_first_turn" or "trim_middle"
+CONTEXT_STRATEGY = os.getenv("CONTEXT_STRATEGY", "drop_oldest").lower()
+# Max number of rendered prompt tokens kept in the per-message render cache (4 bytes each)
+RENDER_CACHE_MAX_TOKENS = int(os.getenv("RENDER_CACHE_MAX_TOKENS", 4_000_000))
+
+# Reasoning budgets: max analysis-channel tokens per reasoning effort (0 = no limit).
+# When a chat response exceeds its budget, the model is switched to the final answer.
+REASONING_BUDGET_LOW = int(os.getenv("REASONING_BUDGET_LOW", 0))
+REASONING_BUDGET_MEDIUM = int(os.getenv("REASONING_BUDGET_MEDIUM", 0))
+REASONING_BUDGET_HIGH = int(os.getenv("REASONING_BUDGET_HIGH", 0))
+# Tokens of max_tokens always left for the final answer (the analysis budget shrinks to fit)
+REASONING_ANSWER_RESERVE = int(os.getenv("REASONING_ANSWER_RESERVE", 200))
+
+# Request preparation (see prep_executor.py)
+# Where chat prompts are rendered and truncated: "thread" (pool of PREP_WORKERS threads),
+# "process" (pool of worker processes, each with its own render cache) or "inline" (on the event loop)
+PREP_EXECUTOR = os.getenv("PREP_EXECUTOR", "thread").lower()
+PREP_WORKERS = int(os.getenv("PREP_WORKERS", 2))
+PREP_MAX_PENDING = int(os.getenv("PREP_MAX_PENDING", 64))  # Jobs queued or running before new ones wait
+# Conversations with less text than this are prepared inline (a pool hand-off would cost more)
+PREP_INLINE_MAX_CHARS = int(os.getenv("PREP_INLINE_MAX_CHARS", 4096))
 DEFAULT_REASONING_EFFORT = os.getenv("DEFAULT_REASONING_EFFORT", "low")
+
+# Admission control (see scheduler.py)
+# Maximum number of sequences handed to the engine concurrently
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 16))
+# Maximum number of requests waiting for a free slot
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", 64))
+# Queue ordering: "fifo" or "priority"
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "fifo").lower()
+# Default maximum time (seconds) a request may wait in the queue
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", 30))
+# Wall-clock deadline (seconds) for one generation, counted from admission (0 = none).
+# Clients can lower it per request with the 'timeout' body field.
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 300))
+# Upper bound for a request's max_tokens (clients can ask for fewer, not more)
+MAX_TOKENS_LIMIT = int(os.getenv("MAX_TOKENS_LIMIT", 4096))
+# Upper bound for a request's 'n' and 'best_of' (samples generated from one prompt)
+MAX_SAMPLES = int(os.getenv("MAX_SAMPLES", 8))
+# Initial guess (seconds) of a generation's duration, used for Retry-After estimates
+SCHEDULER_INITIAL_SERVICE_TIME = float(os.getenv("SCHEDULER_INITIAL_SERVICE_TIME", 10))
+
+# vLLM engine settings
+# Automatic prefix caching reuses the KV cache of shared prompt prefixes (system header, earlier turns)
+ENABLE_PREFIX_CACHING = _env_bool("ENABLE_PREFIX_CACHING", True)
+# Max sequences vLLM schedules per step (should be >= MAX_IN_FLIGHT)
+MAX_NUM_SEQS = int(os.getenv("MAX_NUM_SEQS", MAX_IN_FLIGHT))
+GPU_MEMORY_UTILIZATION = float(os.getenv("GPU_MEMORY_UTILIZATION", 0.9))
+# Split long prefills into chunks so they can be batched with decode steps
+ENABLE_CHUNKED_PREFILL = _env_bool("ENABLE_CHUNKED_PREFILL", True)
+# Number of GPUs to shard the model across
+TENSOR_PARALLEL_SIZE = int(os.getenv("TENSOR_PARALLEL_SIZE", 1))
+
+# Engine backend: "vllm" (GPU) or "simulated" (CPU-only stand-in for load testing)
+ENGINE_BACKEND = os.getenv("ENGINE_BACKEND", "vllm").lower()
+
+# Startup (see startup.py)
+# Load the model in the background: /health/live answers at once, generation waits for /health/ready
+BACKGROUND_LOAD = _env_bool("BACKGROUND_LOAD", True)
+# Before reporting ready, send a short representative chat at each of these reasoning efforts
+WARMUP_ENABLED = _env_bool("WARMUP_ENABLED", True)
+WARMUP_EFFORTS = os.getenv("WARMUP_EFFORTS", "low,medium,high")
+WARMUP_MAX_TOKENS = int(os.getenv("WARMUP_MAX_TOKENS", 32))
+STARTUP_RETRY_AFTER = int(os.getenv("STARTUP_RETRY_AFTER", 10))  # Retry-After (seconds) of 503s while starting
+
+# Multi-worker API (see main.py and engine_server.py)
+# Number of API worker processes. With more than one, the engine runs in a separate
+# engine server process and the workers talk to it over a Unix socket.
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+# Socket of the engine server the API uses (set automatically when API_WORKERS > 1)
+ENGINE_SERVER_SOCKET = os.getenv("ENGINE_SERVER_SOCKET", "")
+
+# Data-parallel engine pool (see engine_pool.py)
+# Number of independent engine replicas, each in its own process (1 = run the engine in-process)
+ENGINE_REPLICAS = int(os.getenv("ENGINE_REPLICAS", 1))
+# CUDA_VISIBLE_DEVICES per replica, separated by ';' (e.g. "0,1;2,3"). Default: TENSOR_PARALLEL_SIZE GPUs each
+REPLICA_DEVICES = os.getenv("REPLICA_DEVICES", "")
+# Directory for the replicas' Unix sockets (default: a per-process temp directory)
+ENGINE_SOCKET_DIR = os.getenv("ENGINE_SOCKET_DIR", "")
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", 5))  # Seconds between health checks
+REPLICA_DRAIN_TIMEOUT = float(os.getenv("REPLICA_DRAIN_TIMEOUT", 300))  # Max seconds to wait for a draining replica
+
+# Simulated engine settings (see simulated_engine.py)
+SIM_TTFT = float(os.getenv("SIM_TTFT", 0.2))                     # Seconds before the first token
+SIM_TOKEN_LATENCY = float(os.getenv("SIM_TOKEN_LATENCY", 0.02))  # Seconds per token with a single sequence
+SIM_BATCH_SLOWDOWN = float(os.getenv("SIM_BATCH_SLOWDOWN", 0.01))  # Extra latency fraction per concurrent sequence
+SIM_REASONING_TOKENS = int(os.getenv("SIM_REASONING_TOKENS", 64))  # Words in the analysis channel
+SIM_OUTPUT_TOKENS = int(os.getenv("SIM_OUTPUT_TOKENS", 128))     # Words in the final channel
+
+# Stream coalescing (see coalesce.py)
+# Deltas are merged into one frame per time window; the first token is always sent immediately.
+# Set STREAM_COALESCE_MS=0 to send every token as its own frame.
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", 20))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", 512))
+
+# Multiplexed WebSocket transport (see routers/stream.py)
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", 64))  # Concurrent generations per connection
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", 256))   # Frames buffered for a slow client before streams pause
+
+# Conversation sessions (see session_store.py)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()  # "memory" or "disk"
+SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))  # Seconds of inactivity before a session expires (0 = never)
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 256 * 1024 * 1024))  # Memory store budget
+SESSION_DIR = os.getenv("SESSION_DIR", "./sessions")  # Disk store directory
+
+# Offline batch jobs (see batch.py)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", MAX_IN_FLIGHT))  # Max requests of one job in the engine at once
+# Batch requests wait behind every interactive request for an engine slot
+BATCH_LOW_PRIORITY = _env_bool("BATCH_LOW_PRIORITY", True)
+# Engine slots background (low-priority batch) requests leave free for interactive requests
+BATCH_RESERVED_SLOTS = int(os.getenv("BATCH_RESERVED_SLOTS", 1))
+BATCH_DIR = os.getenv("BATCH_DIR", "./batches")  # Checkpoints of resumable /batch jobs
+
+# Response cache for deterministic (temperature=0) requests (see response_cache.py)
+RESPONSE_CACHE_ENABLED = _env_bool("RESPONSE_CACHE_ENABLED", False)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))  # Seconds (0 = never expire)
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "")  # Optional on-disk tier
+
+# Observability (see metrics.py)
+# Write one structured JSON log line per request with its stage timings
+TRACE_REQUESTS = _env_bool("TRACE_REQUESTS", False)
+# Fraction of prompts logged (0 disables prompt logging); logging runs off the event loop
+PROMPT_LOG_SAMPLE_RATE = float(os.getenv("PROMPT_LOG_SAMPLE_RATE", 0))
+# Seconds between event loop lag probes (0 disables the monitor)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.1))
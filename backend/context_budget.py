@@ -0,0 +1,195 @@
+import bisect
+import hashlib
+from array import array
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import TYPE_CHECKING, Callable, List, Optional
+from openai_harmony import Conversation, HarmonyEncoding, Message, ReasoningEffort, Role
+import config
+from prompt_cache import EMPTY_PREFIX, RenderCache, prefix_hash
+
+if TYPE_CHECKING:
+    from metrics import RequestTrace
+
+# ------------------------------------------------------------------------------
+# Context Budgeting
+# ------------------------------------------------------------------------------
+
+# Truncation strategies
+STRATEGY_DROP_OLDEST = "drop_oldest"          # Keep the system message, drop the oldest turns
+STRATEGY_KEEP_FIRST_TURN = "keep_first_turn"  # Also keep the first user turn (and its reply)
+STRATEGY_TRIM_MIDDLE = "trim_middle"          # Keep the start and the end, drop the middle
+STRATEGIES = (STRATEGY_DROP_OLDEST, STRATEGY_KEEP_FIRST_TURN, STRATEGY_TRIM_MIDDLE)
+
+class ContextOverflow(ValueError):
+    """Raised when even the system message and the last message don't fit the context budget."""
+
+
+# Builds the Harmony messages for one (role, content, reasoning effort); empty for invalid input
+MessageBuilder = Callable[[str, str, ReasoningEffort], List[Message]]
+
+
+def message_key(role: str, content: str, reasoning_effort: ReasoningEffort) -> bytes:
+    """Content hash identifying a rendered message (the system message also depends on effort)."""
+    effort = reasoning_effort.value if role == "system" else ""
+    return hashlib.blake2b(f"{role}\0{effort}\0{content}".encode("utf-8"), digest_size=16).digest()
+
+
+@dataclass
+class FittedPrompt:
+    """A rendered prompt that fits the context budget."""
+    token_ids: List[int]
+    # Hash of the kept conversation prefix (identical conversations give identical hashes)
+    prefix_hash: bytes
+    kept_messages: int
+    dropped_messages: int
+
+
+class ContextBudgeter:
+    """
+    Fits a chat history into the model's context window using real token counts,
+    and renders the prompt token IDs.
+
+    Each message is rendered with the Harmony encoding, including its framing
+    tokens (<|start|>role<|message|> ... <|end|>), and the token IDs are kept in a
+    RenderCache under the message's content hash. On later turns only new
+    messages are built and tokenized; the prompt is the concatenation of cached
+    token arrays plus the assistant header. The cut point is chosen in a single
+    pass over prefix sums of the counts.
+    """
+
+    def __init__(self, encoding: HarmonyEncoding, build_message: MessageBuilder, cache: Optional[RenderCache] = None):
+        self._encoding = encoding
+        self._build_message = build_message
+        self.cache = cache if cache is not None else RenderCache()
+        # Tokens appended after the history to start the assistant's turn
+        self._completion_suffix = array("I", encoding.render_conversation_for_completion(Conversation(messages=[]), Role.ASSISTANT))
+        self.completion_overhead = len(self._completion_suffix)
+
+    def render(self, key: bytes, role: str, content: str, reasoning_effort: ReasoningEffort) -> Optional[array]:
+        """Returns the rendered token IDs of a message, building it only on a cache miss."""
+        tokens = self.cache.get(key)
+        if tokens is not None:
+            return tokens
+        messages = self._build_message(role, content, reasoning_effort)
+        if not messages:
+            return None
+        tokens = []
+        for message in messages:
+            tokens.extend(self._encoding.render(message))
+        return self.cache.put(key, tokens)
+
+    def fit(
+        self,
+        raw_messages: List[dict],
+        reasoning_effort: ReasoningEffort,
+        reserve_tokens: int,
+        max_context_tokens: int = config.MAX_CONTEXT_TOKENS,
+        strategy: str = config.CONTEXT_STRATEGY,
+        trace: Optional["RequestTrace"] = None,
+    ) -> FittedPrompt:
+        """
+        Renders the prompt for the messages that fit in `max_context_tokens - reserve_tokens`.
+
+        Args:
+            raw_messages (List[dict]): Messages as sent by the client ({"role", "content"}).
+            reasoning_effort (ReasoningEffort): Applied to the system message.
+            reserve_tokens (int): Room kept free for the generated output (max_tokens).
+            max_context_tokens (int): The model's context budget.
+            strategy (str): One of STRATEGIES.
+            trace (RequestTrace | None): Receives the "render" and "truncate" stage timings.
+
+        Returns:
+            FittedPrompt: Token IDs ready to send to the engine.
+
+        Raises:
+            ContextOverflow: If the system message and the last message alone exceed the budget.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown context strategy: {strategy}")
+
+        rendered: List[array] = []
+        keys: List[bytes] = []
+        roles: List[str] = []
+        for raw in raw_messages:
+            role, content = raw.get("role"), raw.get("content")
+            # An empty system message still renders the (canonical) system header
+            if not role or (not content and role != "system"):
+                continue
+            content = content or ""
+            key = message_key(role, content, reasoning_effort)
+            tokens = self.render(key, role, content, reasoning_effort)
+            if tokens is None:
+                continue
+            rendered.append(tokens)
+            keys.append(key)
+            roles.append(role)
+        if trace is not None:
+            trace.mark("render")
+
+        budget = max_context_tokens - reserve_tokens - self.completion_overhead
+        keep = self._select([len(t) for t in rendered], roles, budget, strategy)
+
+        prompt = array("I")
+        h = EMPTY_PREFIX
+        for i in keep:
+            prompt.extend(rendered[i])
+            h = prefix_hash(h, keys[i])
+        prompt.extend(self._completion_suffix)
+        if trace is not None:
+            trace.mark("truncate")
+
+        return FittedPrompt(
+            token_ids=prompt.tolist(),
+            prefix_hash=h,
+            kept_messages=len(keep),
+            dropped_messages=len(rendered) - len(keep),
+        )
+
+    @staticmethod
+    def _select(counts: List[int], roles: List[str], budget: int, strategy: str) -> List[int]:
+        """Returns the indices of the messages to keep."""
+        n = len(counts)
+        if n == 0:
+            return []
+
+        # prefix[i] = tokens in messages[0:i]
+        prefix = [0] + list(accumulate(counts))
+
+        # Pinned messages: the leading system message, plus the first turn if requested
+        pinned_end = 1 if roles[0] == "system" else 0
+        if prefix[pinned_end] + (counts[-1] if pinned_end < n else 0) > budget:
+            raise ContextOverflow(
+                f"The last message does not fit in the context window ({budget} tokens left after max_tokens)"
+            )
+        if strategy == STRATEGY_KEEP_FIRST_TURN:
+            # Never pin the last message: it is always kept as part of the tail
+            first_turn = min(_first_turn_end(roles, pinned_end), n - 1)
+            # Pin the first turn only if it fits next to the last message (else this is drop_oldest)
+            if prefix[first_turn] + counts[-1] <= budget:
+                pinned_end = first_turn
+
+        remaining = budget - prefix[pinned_end]
+
+        # The head of a trim_middle cut: the longest run after the pinned part within half the budget
+        head_end = pinned_end
+        if strategy == STRATEGY_TRIM_MIDDLE and remaining > 0:
+            head_end = bisect.bisect_right(prefix, prefix[pinned_end] + remaining // 2, pinned_end, n) - 1
+            head_end = max(pinned_end, min(head_end, n - 1))
+            remaining -= prefix[head_end] - prefix[pinned_end]
+
+        # The tail: the longest suffix that fits in what is left (always at least the last message)
+        tail_start = bisect.bisect_left(prefix, prefix[n] - remaining, head_end, n)
+        tail_start = max(min(tail_start, n - 1), head_end)
+
+        return list(range(head_end)) + list(range(tail_start, n))
+
+
+def _first_turn_end(roles: List[str], start: int) -> int:
+    """Index just past the first user message and the assistant reply that follows it."""
+    end = start
+    if end < len(roles) and roles[end] == "user":
+        end += 1
+        if end < len(roles) and roles[end] == "assistant":
+            end += 1
+    return end
@@ -1,30 +1,26 @@
-from typing import AsyncGenerator, Union, List
-import json
+from typing import AsyncIterator, Optional, Union, List
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
-from vllm.sampling_params import SamplingParams
-from vllm.utils import random_uuid
+from vllm.sampling_params import RequestOutputKind, SamplingParams
 from vllm.inputs.data import TokensPrompt
 import config
+from engine_base import EngineBackend, EngineOutput, SamplingConfig
 
-class LLMEngine:
+class LLMEngine(EngineBackend):
     """
     A Singleton wrapper around the vLLM AsyncLLMEngine.
-    
+
     This class handles the initialization of the model and provides
     a clean method to generate streaming responses.
+    Concurrent requests are admitted through an AdmissionScheduler so that
+    vLLM's continuous batching can run several sequences at once.
     """
-    
-    _instance = None
+
     _engine: AsyncLLMEngine = None
-    _is_generating: bool = False
 
-    def __new__(cls):
-        """Ensure only one instance of the engine wrapper exists."""
-        if cls._instance is None:
-            cls._instance = super(LLMEngine, cls).__new__(cls)
-            cls._instance._is_generating = False
-        return cls._instance
+    @property
+    def is_initialized(self) -> bool:
+        return self._engine is not None
 
     def initialize(self):
         """
@@ -35,74 +31,71 @@ class LLMEngine:
             return
 
         print(f"🔄 Initializing vLLM Engine with model: {config.MODEL_NAME}...")
-        
+
         # Configure the engine arguments
         engine_args = AsyncEngineArgs(
             model=config.MODEL_NAME,
             trust_remote_code=True,  # Often required for new/custom architectures
-            # tensor_parallel_size=1  # Set this to the number of GPUs you have
+            tensor_parallel_size=config.TENSOR_PARALLEL_SIZE,
+            enable_prefix_caching=config.ENABLE_PREFIX_CACHING,
+            enable_chunked_prefill=config.ENABLE_CHUNKED_PREFILL,
+            max_num_seqs=config.MAX_NUM_SEQS,
+            gpu_memory_utilization=config.GPU_MEMORY_UTILIZATION,
         )
-        
+
         # Create the engine
         self._engine = AsyncLLMEngine.from_engine_args(engine_args)
         print("✅ vLLM Engine initialized successfully.")
 
-    @property
-    def is_busy(self) -> bool:
-        return self._is_generating
-
-    async def generate_stream(self, prompt: Union[str, List[int]], **kwargs) -> AsyncGenerator[str, None]:
-        """
-        Generates text based on the prompt and yields chunks of the response.
-        
-        Args:
-            prompt (str | List[int]): The input text or token IDs to the model.
-            **kwargs: Overrides for sampling parameters (temperature, max_tokens, etc.)
-        
-        Yields:
-            str: JSON formatted string containing the text delta.
-        """
-        if self._engine is None:
-            raise RuntimeError("Engine not initialized. Call initialize() first.")
-            
-        if self._is_generating:
-            # Simple blocking mechanism as requested
-            raise RuntimeError("Busy: A generation is already in progress.")
+    async def _generate(self, prompt: Union[str, List[int]], sampling: SamplingConfig, request_id: str, affinity_key: Optional[str] = None, priority: int = 0, background: bool = False) -> AsyncIterator[EngineOutput]:
+        # Set up vLLM sampling parameters
+        sampling_params = SamplingParams(
+            temperature=sampling.temperature,
+            top_p=sampling.top_p,
+            max_tokens=sampling.max_tokens,
+            skip_special_tokens=sampling.skip_special_tokens,
+            detokenize=sampling.detokenize,
+            stop_token_ids=sampling.stop_token_ids or None,
+            # n samples share one prefill of the prompt
+            n=sampling.n,
+            seed=sampling.seed,
+            logprobs=sampling.logprobs,
+            # Only return what was generated since the previous step
+            output_kind=RequestOutputKind.DELTA
+        )
 
-        try:
-            self._is_generating = True
-            
-            # Set up sampling parameters, using defaults from config if not provided
-            sampling_params = SamplingParams(
-                temperature=kwargs.get("temperature", config.DEFAULT_TEMPERATURE),
-                top_p=kwargs.get("top_p", config.DEFAULT_TOP_P),
-                max_tokens=kwargs.get("max_tokens", config.DEFAULT_MAX_TOKENS),
-                skip_special_tokens=kwargs.get("skip_special_tokens", True)
-            )
+        # Handle different prompt types
+        if isinstance(prompt, list):
+            # vLLM expects a TokensPrompt (TypedDict) for token IDs
+            inputs = TokensPrompt(prompt_token_ids=prompt)
+        else:
+            inputs = prompt
 
-            request_id = random_uuid()
-            
-            # Handle different prompt types
-            if isinstance(prompt, list):
-                # vLLM expects a TokensPrompt (TypedDict) for token IDs
-                inputs = TokensPrompt(prompt_token_ids=prompt)
-            else:
-                inputs = prompt
+        # Initiate the generation process
+        results_generator = self._engine.generate(inputs, sampling_params, request_id)
 
-            # Initiate the generation process
-            results_generator = self._engine.generate(inputs, sampling_params, request_id)
+        # Iterate over the stream.
+        # In DELTA mode each RequestOutput only carries the newly generated text and tokens
+        # (of each sample that advanced, when n > 1).
+        # If this generator is closed early, EngineBackend.generate() calls abort().
+        first = True
+        with_logprobs = sampling.logprobs is not None
+        async for request_output in results_generator:
+            for completion in request_output.outputs:
+                output = EngineOutput(
+                    text=completion.text,
+                    token_ids=list(completion.token_ids),
+                    finish_reason=completion.finish_reason,
+                    index=completion.index,
+                    cumulative_logprob=completion.cumulative_logprob if with_logprobs else None,
+                )
+                if first:
+                    # Report how much of the prompt was served from the prefix cache
+                    first = False
+                    output.prompt_tokens = len(request_output.prompt_token_ids or [])
+                    output.cached_tokens = getattr(request_output, "num_cached_tokens", None) or 0
+                yield output
 
-            # Iterate over the stream
-            last_output_text = ""
-            async for request_output in results_generator:
-                # vLLM returns the full generated text at every step.
-                # We calculate the 'delta' (newly generated text) to stream back to the client.
-                full_text = request_output.outputs[0].text
-                delta = full_text[len(last_output_text):]
-                last_output_text = full_text
-                
-                # Yield the delta formatted as a JSON string for the client
-                yield json.dumps({"text": delta}) + "\n"
-                
-        finally:
-            self._is_generating = False
+    async def abort(self, request_id: str):
+        # Frees the sequence's KV cache blocks and stops further decode steps
+        await self._engine.abort(request_id)
@@ -0,0 +1,425 @@
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterator, Dict, List, Optional, Set, Union
+import asyncio
+import json
+import time
+import uuid
+import config
+from coalesce import coalesce_outputs
+from frames import text_frame
+from scheduler import AdmissionScheduler, Slot
+
+if TYPE_CHECKING:
+    from metrics import RequestTrace
+
+# ------------------------------------------------------------------------------
+# Engine Backend Interface
+# ------------------------------------------------------------------------------
+
+# Finish reason reported when a request runs past its wall-clock deadline
+FINISH_TIMEOUT = "timeout"
+
+
+@dataclass
+class SamplingConfig:
+    """Backend-neutral sampling parameters for one request."""
+    temperature: float = config.DEFAULT_TEMPERATURE
+    top_p: float = config.DEFAULT_TOP_P
+    max_tokens: int = config.DEFAULT_MAX_TOKENS
+    skip_special_tokens: bool = True
+    # When False only token IDs are produced (callers that parse tokens skip detokenization)
+    detokenize: bool = True
+    # Token IDs that end the sequence (e.g. Harmony's <|return|> and <|call|>)
+    stop_token_ids: List[int] = field(default_factory=list)
+    # Number of samples generated from one prefill of the prompt
+    n: int = 1
+    seed: Optional[int] = None
+    # Set (e.g. to 0) to get each sample's cumulative log probability
+    logprobs: Optional[int] = None
+
+
+@dataclass
+class EngineOutput:
+    """One step of generated output (only the newly generated part) of one sample."""
+    text: str
+    token_ids: List[int] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+    # Set on the first output of a request
+    prompt_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    # Which sample this output belongs to (requests with n > 1)
+    index: int = 0
+    # Log probability of the sample so far (only when logprobs were requested)
+    cumulative_logprob: Optional[float] = None
+
+    @classmethod
+    def merge(cls, outputs: List["EngineOutput"]) -> "EngineOutput":
+        """Concatenates consecutive deltas of one sample into a single frame."""
+        token_ids = []
+        for output in outputs:
+            token_ids.extend(output.token_ids)
+        return cls(
+            text="".join(output.text for output in outputs),
+            token_ids=token_ids,
+            finish_reason=outputs[-1].finish_reason,
+            prompt_tokens=outputs[0].prompt_tokens,
+            cached_tokens=outputs[0].cached_tokens,
+            index=outputs[0].index,
+            cumulative_logprob=outputs[-1].cumulative_logprob,
+        )
+
+
+class StreamStats:
+    """Accumulates per-request usage from a stream of EngineOutputs."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.finish_reason: Optional[str] = None
+        # index -> [completion tokens, finish reason, cumulative logprob] per sample
+        self.samples: Dict[int, list] = {}
+
+    def update(self, output: EngineOutput):
+        if output.prompt_tokens is not None:
+            self.prompt_tokens = output.prompt_tokens
+        if output.cached_tokens is not None:
+            self.cached_tokens = output.cached_tokens
+        self.completion_tokens += len(output.token_ids)
+        if output.finish_reason is not None:
+            self.finish_reason = output.finish_reason
+        sample = self.samples.get(output.index)
+        if sample is None:
+            sample = self.samples[output.index] = [0, None, None]
+        sample[0] += len(output.token_ids)
+        if output.finish_reason is not None:
+            sample[1] = output.finish_reason
+        if output.cumulative_logprob is not None:
+            sample[2] = output.cumulative_logprob
+
+    def sample_info(self, index: int) -> dict:
+        """Finish reason and token count of one sample."""
+        completion_tokens, finish_reason, _ = self.samples.get(index, (0, None, None))
+        return {"index": index, "finish_reason": finish_reason, "completion_tokens": completion_tokens}
+
+    def best_samples(self, n: int) -> List[int]:
+        """Indices of the `n` samples with the highest cumulative log probability (best_of)."""
+        ranked = sorted(self.samples, key=lambda i: self.samples[i][2] if self.samples[i][2] is not None else float("-inf"), reverse=True)
+        return sorted(ranked[:n])
+
+    def done_event(self, trace: Optional["RequestTrace"] = None) -> dict:
+        """The final status frame sent at the end of a stream (with stage timings if requested)."""
+        event = {
+            "type": "done",
+            "finish_reason": self.finish_reason,
+            "usage": {
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_tokens,
+                "completion_tokens": self.completion_tokens,
+            },
+        }
+        if len(self.samples) > 1:
+            event["samples"] = [self.sample_info(index) for index in sorted(self.samples)]
+        if trace is not None and trace.include_timings:
+            event["timings_ms"] = trace.timings()
+        return event
+
+
+class GenerationControl:
+    """
+    Steers a generation from the tokens it produces (see harmony_stream.HarmonyControl).
+
+    `EngineBackend.generate()` calls `observe()` with every frame's token IDs.
+    Setting `stop` ends the sequence (finish_reason "stop") and aborts the engine
+    request; returning tokens from `observe()` appends them to the sequence and
+    generation continues after them.
+    """
+
+    stop: bool = False
+
+    def observe(self, token_ids: List[int]) -> Optional[List[int]]:
+        """Returns tokens to force into the sequence, or None to keep generating."""
+        return None
+
+
+class EngineBackend:
+    """
+    Base class for inference backends.
+
+    Each backend is a process-wide singleton. Subclasses implement `initialize()`
+    and `_generate()`; admission control, frame coalescing and NDJSON streaming
+    are shared here.
+    """
+
+    _instance = None
+    scheduler: AdmissionScheduler = None
+    # Whether generate() coalesces deltas into frames. Backends that forward requests to
+    # engine servers turn it off: the server coalesces before the IPC hop.
+    coalesce = True
+    # Abort calls still running (kept referenced until they finish)
+    _aborts: Set[asyncio.Task] = None
+
+    def __new__(cls):
+        """Ensure only one instance of each backend exists."""
+        if cls.__dict__.get("_instance") is None:
+            instance = super(EngineBackend, cls).__new__(cls)
+            instance.scheduler = cls._create_scheduler()
+            instance._aborts = set()
+            cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def _create_scheduler(cls) -> AdmissionScheduler:
+        """Admission control for this backend (MAX_IN_FLIGHT concurrent sequences)."""
+        return AdmissionScheduler()
+
+    @property
+    def is_initialized(self) -> bool:
+        raise NotImplementedError
+
+    def initialize(self):
+        """Loads the model (or whatever the backend needs) before serving requests."""
+        raise NotImplementedError
+
+    def shutdown(self):
+        """Releases resources held by the backend (no-op by default)."""
+
+    async def _generate(
+        self,
+        prompt: Union[str, List[int]],
+        sampling: SamplingConfig,
+        request_id: str,
+        affinity_key: Optional[str] = None,
+        priority: int = 0,
+        background: bool = False,
+    ) -> AsyncIterator[EngineOutput]:
+        """
+        Runs one request and yields incremental outputs.
+        `affinity_key` is a routing hint for multi-replica backends, and `priority` and
+        `background` are how the request was admitted; backends that forward requests
+        to engine servers pass them on (single engines ignore them).
+        """
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def abort(self, request_id: str):
+        """Stops an unfinished request and frees its engine resources (no-op by default)."""
+
+    def _abort_in_background(self, request_id: str):
+        """
+        Schedules `abort()` as its own task. Streams are usually closed while their task
+        is being cancelled (client disconnect), where any await in cleanup code would be
+        cancelled too and the engine would keep decoding until max_tokens.
+        """
+        task = asyncio.ensure_future(self.abort(request_id))
+        self._aborts.add(task)
+        task.add_done_callback(self._aborts.discard)
+
+    @property
+    def is_busy(self) -> bool:
+        """True when every in-flight slot is taken (new requests will queue)."""
+        return self.scheduler.is_saturated
+
+    @staticmethod
+    def build_sampling(**kwargs) -> SamplingConfig:
+        """
+        Builds a SamplingConfig from request overrides, ignoring unset values.
+        max_tokens is capped at MAX_TOKENS_LIMIT (the server's token deadline).
+        """
+        sampling = SamplingConfig(**{k: v for k, v in kwargs.items() if v is not None})
+        sampling.max_tokens = min(sampling.max_tokens, config.MAX_TOKENS_LIMIT)
+        return sampling
+
+    async def generate(
+        self,
+        prompt: Union[str, List[int]],
+        slot: Optional[Slot] = None,
+        timeout: Optional[float] = None,
+        trace: Optional["RequestTrace"] = None,
+        affinity_key: Optional[str] = None,
+        control: Optional[GenerationControl] = None,
+        **kwargs,
+    ) -> AsyncGenerator[EngineOutput, None]:
+        """
+        Generates text for the prompt and yields EngineOutput deltas.
+
+        If the stream is closed before the sequence finishes (client disconnect,
+        error, deadline), the engine request is aborted right away.
+
+        Args:
+            prompt (str | List[int]): The input text or token IDs to the model.
+            slot (Slot | None): A slot already acquired from the scheduler.
+                If omitted, one is acquired here (waiting in the queue if needed).
+            timeout (float | None): Wall-clock deadline in seconds, counted from admission.
+                When it passes, generation stops with finish_reason "timeout".
+            trace (RequestTrace | None): Records queue wait, token timings and counts.
+            affinity_key (str | None): Conversation or session key; replicas of an
+                engine pool prefer to serve the same key (their prefix cache is warm).
+            control (GenerationControl | None): Can stop the sequence early or force tokens into it
+                (single-sample requests with token ID prompts only). Forced tokens are yielded as an output of their own and the
+                generation continues as a new engine request over prompt + generated + forced tokens,
+                in the same slot and under the same deadline and max_tokens.
+            **kwargs: Overrides for sampling parameters (temperature, max_tokens, n, seed, etc.)
+                With n > 1 the samples' outputs are interleaved, each tagged with its index.
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Engine not initialized. Call initialize() first.")
+
+        if slot is None:
+            slot = await self.scheduler.acquire()
+        if trace is not None:
+            trace.admitted(slot.queue_wait)
+
+        stream = None
+        finished = False
+        request_id = uuid.uuid4().hex
+        # The deadline is checked as outputs arrive, and bounds the wait for the next one
+        # (a request stuck in prefill, or on a stalled engine server, still times out)
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            sampling = self.build_sampling(**kwargs)
+            if not isinstance(prompt, list) or sampling.n > 1:
+                control = None
+            # Samples that haven't finished yet
+            pending = set(range(sampling.n))
+            continued = False
+            while True:
+                stream = self._generate(prompt, sampling, request_id, affinity_key, slot.priority, slot.background)
+                if self.coalesce and config.STREAM_COALESCE_MS > 0:
+                    # Merge per-token deltas into frames to cut per-token overhead downstream
+                    stream = coalesce_outputs(stream, config.STREAM_COALESCE_MS / 1000, config.STREAM_COALESCE_BYTES)
+                generated: List[int] = []
+                forced = None
+                stopped = False
+                while True:
+                    try:
+                        output = await self._next_output(stream, deadline)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        for index in sorted(pending):
+                            yield self._final_output(FINISH_TIMEOUT, trace, index)
+                        stopped = True
+                        break
+                    if output.finish_reason is not None:
+                        pending.discard(output.index)
+                    finished = not pending
+                    if continued:
+                        # Usage reports the original prompt, not the continuation's
+                        output.prompt_tokens = output.cached_tokens = None
+                    if trace is not None:
+                        trace.on_output(output)
+                    yield output
+                    if not finished and deadline is not None and time.monotonic() >= deadline:
+                        for index in sorted(pending):
+                            yield self._final_output(FINISH_TIMEOUT, trace, index)
+                        stopped = True
+                        break
+                    if control is not None and not finished:
+                        generated.extend(output.token_ids)
+                        forced = control.observe(output.token_ids)
+                        if control.stop:
+                            yield self._final_output("stop", trace)
+                            stopped = True
+                            break
+                        if forced:
+                            break
+                if stopped or not forced:
+                    break
+
+                # Continue after the forced tokens as a new request (its prompt prefix is cached)
+                self._abort_in_background(request_id)
+                await stream.aclose()
+                stream = None
+                remaining = sampling.max_tokens - len(generated) - len(forced)
+                output = EngineOutput(text="", token_ids=forced, finish_reason=None if remaining > 0 else "length")
+                if trace is not None:
+                    trace.on_output(output)
+                yield output
+                if remaining <= 0:
+                    break
+                prompt = prompt + generated + forced
+                sampling = replace(sampling, max_tokens=remaining)
+                request_id = uuid.uuid4().hex
+                continued = True
+        finally:
+            slot.release()
+            if trace is not None:
+                trace.finish()
+            if stream is not None:
+                if not finished:
+                    self._abort_in_background(request_id)
+                await stream.aclose()
+
+    @staticmethod
+    async def _next_output(stream: AsyncIterator[EngineOutput], deadline: Optional[float]) -> EngineOutput:
+        """
+        Waits for the stream's next output, until the deadline (if any).
+
+        Raises:
+            StopAsyncIteration: The stream ended.
+            asyncio.TimeoutError: The deadline passed first (the stream is then closed).
+        """
+        if deadline is None:
+            return await stream.__anext__()
+        return await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - time.monotonic()))
+
+    @staticmethod
+    def _final_output(finish_reason: str, trace: Optional["RequestTrace"], index: int = 0) -> EngineOutput:
+        """An empty output ending a sample that the engine hasn't finished (deadline, early stop)."""
+        output = EngineOutput(text="", finish_reason=finish_reason, index=index)
+        if trace is not None:
+            trace.on_output(output)
+        return output
+
+    async def generate_stream(
+        self,
+        prompt: Union[str, List[int]],
+        slot: Optional[Slot] = None,
+        timeout: Optional[float] = None,
+        trace: Optional["RequestTrace"] = None,
+        **kwargs,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Generates text based on the prompt and yields chunks of the response.
+
+        Yields:
+            str: JSON formatted string containing the text delta (tagged with the sample
+                "index" when n > 1), followed by a final {"type": "done", ...} frame with token usage.
+        """
+        stats = StreamStats()
+        tag = kwargs.get("n", 1) > 1
+        outputs = self.generate(prompt, slot=slot, timeout=timeout, trace=trace, **kwargs)
+        try:
+            async for output in outputs:
+                stats.update(output)
+                if output.text:
+                    yield text_frame(output.text, output.index if tag else None)
+            yield json.dumps(stats.done_event(trace)) + "\n"
+        finally:
+            # Aborts the engine request and frees the slot right away if the consumer stops early
+            await outputs.aclose()
+
+
+def get_engine() -> EngineBackend:
+    """
+    Returns the engine backend selected by config.ENGINE_BACKEND, an engine
+    pool if ENGINE_REPLICAS > 1, or a client of a separate engine server if
+    ENGINE_SERVER_SOCKET is set.
+    Backends are imported lazily so that e.g. the simulated engine never imports vLLM.
+    """
+    if config.ENGINE_SERVER_SOCKET:
+        # API worker: the engine runs in a separate engine server process
+        from engine_client import RemoteEngine
+        return RemoteEngine()
+    if config.ENGINE_REPLICAS > 1:
+        # Data-parallel replicas, each running ENGINE_BACKEND in its own process
+        from engine_pool import EnginePool
+        return EnginePool()
+    if config.ENGINE_BACKEND == "vllm":
+        from engine import LLMEngine
+        return LLMEngine()
+    if config.ENGINE_BACKEND == "simulated":
+        from simulated_engine import SimulatedEngine
+        return SimulatedEngine()
+    raise ValueError(f"Unknown ENGINE_BACKEND: {config.ENGINE_BACKEND}")
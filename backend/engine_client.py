@@ -0,0 +1,203 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Union
+import config
+import engine_protocol as protocol
+from engine_base import EngineBackend, EngineOutput, SamplingConfig
+from scheduler import AdmissionRejected
+
+# ------------------------------------------------------------------------------
+# Engine Server Client
+# ------------------------------------------------------------------------------
+
+class EngineConnection:
+    """
+    One connection to an engine server (engine_server.py).
+
+    Many requests are multiplexed over the connection: a reader task routes
+    output frames to per-request queues. If the connection drops, every open
+    stream fails with ConnectionError (streams on other connections are unaffected).
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._streams: Dict[str, asyncio.Queue] = {}
+        self._pings: Deque[asyncio.Future] = deque()
+
+    @property
+    def connected(self) -> bool:
+        return self._read_task is not None and not self._read_task.done()
+
+    @property
+    def open_streams(self) -> int:
+        return len(self._streams)
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._read_task is not None:
+            self._read_task.cancel()
+
+    async def _read_loop(self):
+        error: BaseException = ConnectionError(f"Engine server connection closed ({self.socket_path})")
+        try:
+            while True:
+                msg_type, payload = await protocol.read_frame(self._reader)
+                if msg_type == protocol.MSG_OUTPUT:
+                    request_id, *fields = protocol.decode_output(payload)
+                    queue = self._streams.get(request_id)
+                    if queue is not None:
+                        queue.put_nowait(EngineOutput(*fields))
+                elif msg_type == protocol.MSG_END:
+                    queue = self._streams.get(protocol.decode_request_id(payload))
+                    if queue is not None:
+                        queue.put_nowait(None)
+                elif msg_type == protocol.MSG_ERROR:
+                    request_id, info = protocol.decode_error(payload)
+                    queue = self._streams.get(request_id)
+                    if queue is not None:
+                        if "reason" in info:
+                            queue.put_nowait(AdmissionRejected(info["reason"], info["retry_after"]))
+                        else:
+                            queue.put_nowait(RuntimeError(f"Engine server error: {info['error']}"))
+                elif msg_type == protocol.MSG_PONG:
+                    if self._pings:
+                        future = self._pings.popleft()
+                        if not future.done():
+                            future.set_result(protocol.decode_pong(payload))
+                else:
+                    raise protocol.ProtocolError(f"Unexpected message type {msg_type}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except protocol.ProtocolError as e:
+            error = ConnectionError(str(e))
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            for queue in self._streams.values():
+                queue.put_nowait(error)
+            while self._pings:
+                future = self._pings.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    async def ping(self, timeout: float) -> dict:
+        """Returns the server's load stats (in_flight, queue_depth)."""
+        if not self.connected:
+            raise ConnectionError(f"Not connected to {self.socket_path}")
+        future = asyncio.get_running_loop().create_future()
+        self._pings.append(future)
+        self._writer.write(protocol.encode_ping())
+        return await asyncio.wait_for(future, timeout)
+
+    async def generate(
+        self,
+        prompt: Union[str, List[int]],
+        sampling: SamplingConfig,
+        request_id: str,
+        priority: int = 0,
+        background: bool = False,
+        affinity_key: Optional[str] = None,
+    ) -> AsyncIterator[EngineOutput]:
+        """
+        Streams a request's outputs. Closing the stream early aborts it on the server.
+        `priority` and `background` order the request in the server's scheduler;
+        `affinity_key` routes it when the server runs an engine pool.
+        """
+        if not self.connected:
+            raise ConnectionError(f"Not connected to {self.socket_path}")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self._streams[request_id] = queue
+        options = {"sampling": sampling.__dict__, "priority": priority, "background": background, "affinity_key": affinity_key}
+        self._writer.write(protocol.encode_generate(request_id, prompt, options))
+        finished = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    # End of stream (the server is done with the request)
+                    finished = True
+                    break
+                if isinstance(item, BaseException):
+                    finished = True
+                    raise item
+                yield item
+        finally:
+            self._streams.pop(request_id, None)
+            if not finished and self.connected:
+                self._writer.write(protocol.encode_abort(request_id))
+
+
+class RemoteEngine(EngineBackend):
+    """
+    Engine backend for API worker processes: forwards every request to a shared
+    engine server (ENGINE_SERVER_SOCKET) instead of loading a model.
+
+    Several stateless API workers can then parse requests, render Harmony prompts
+    and serialize streams on their own CPU cores while one engine drives the GPU.
+    Each worker admits up to MAX_IN_FLIGHT sequences; the engine server's own
+    scheduler orders requests across workers. The connection is re-established
+    if the engine server restarts.
+    """
+
+    _connection: Optional[EngineConnection] = None
+    _connecting: Optional[asyncio.Lock] = None
+    _initialized: bool = False
+    # The engine server already sends coalesced frames
+    coalesce = False
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._initialized
+
+    def initialize(self):
+        """Waits for the engine server to be listening (it may still be loading the model)."""
+        if self._initialized:
+            return
+        print(f"🔄 Waiting for engine server at {config.ENGINE_SERVER_SOCKET}...")
+        while not os.path.exists(config.ENGINE_SERVER_SOCKET):
+            time.sleep(0.5)
+        self._initialized = True
+        print("✅ Engine server available.")
+
+    def shutdown(self):
+        if self._connection is not None:
+            self._connection.close()
+
+    async def _connected(self) -> EngineConnection:
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._connection is None or not self._connection.connected:
+                connection = EngineConnection(config.ENGINE_SERVER_SOCKET)
+                await connection.connect()
+                self._connection = connection
+        return self._connection
+
+    async def _generate(
+        self,
+        prompt: Union[str, List[int]],
+        sampling: SamplingConfig,
+        request_id: str,
+        affinity_key: Optional[str] = None,
+        priority: int = 0,
+        background: bool = False,
+    ) -> AsyncIterator[EngineOutput]:
+        connection = await self._connected()
+        stream = connection.generate(prompt, sampling, request_id, priority, background, affinity_key)
+        try:
+            async for output in stream:
+                yield output
+        finally:
+            # Closing the stream early aborts the request on the engine server
+            await stream.aclose()
@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import os
+import subprocess
+import tempfile
+import time
+from typing import AsyncIterator, List, Optional, Union
+import config
+from engine_base import EngineBackend, EngineOutput, SamplingConfig
+from engine_client import EngineConnection
+from engine_server import launch, wait_until_serving
+from scheduler import AdmissionScheduler
+
+# ------------------------------------------------------------------------------
+# Data-Parallel Engine Pool
+# ------------------------------------------------------------------------------
+
+# Replica states
+STATE_STARTING = "starting"    # Process launched, engine loading
+STATE_READY = "ready"          # Serving requests
+STATE_DRAINING = "draining"    # Finishing in-flight requests, no new ones routed
+STATE_UNHEALTHY = "unhealthy"  # Crashed or not answering health checks; being restarted
+
+# Consecutive failed health checks before a replica is restarted
+MAX_PING_FAILURES = 3
+
+
+class Replica:
+    """One engine server process and the pool's connection to it."""
+
+    def __init__(self, index: int, devices: str, socket_path: str):
+        self.index = index
+        self.devices = devices
+        self.socket_path = socket_path
+        self.process: Optional[subprocess.Popen] = None
+        self.connection: Optional[EngineConnection] = None
+        self.state = STATE_STARTING
+        # Requests and tokens (prompt + max_tokens) routed here and not finished yet
+        self.active = 0
+        self.active_tokens = 0
+        # Load reported by the server's last health check
+        self.queue_depth = 0
+        self.ping_failures = 0
+        self.restarts = 0
+        self.restarting = False
+        self.started_at = 0.0
+
+    @property
+    def routable(self) -> bool:
+        return self.state == STATE_READY and self.connection is not None and self.connection.connected
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "state": self.state,
+            "devices": self.devices,
+            "pid": self.process.pid if self.process else None,
+            "active": self.active,
+            "active_tokens": self.active_tokens,
+            "queue_depth": self.queue_depth,
+            "restarts": self.restarts,
+            "uptime": round(time.monotonic() - self.started_at, 1),
+        }
+
+
+def replica_devices(count: int) -> List[str]:
+    """
+    CUDA_VISIBLE_DEVICES for each replica: REPLICA_DEVICES ("0,1;2,3") if set,
+    otherwise consecutive groups of TENSOR_PARALLEL_SIZE GPUs.
+    """
+    if config.REPLICA_DEVICES:
+        groups = [group.strip() for group in config.REPLICA_DEVICES.split(";")]
+        if len(groups) != count:
+            raise ValueError(f"REPLICA_DEVICES lists {len(groups)} device sets for {count} replicas")
+        return groups
+    tp = config.TENSOR_PARALLEL_SIZE
+    return [",".join(str(i * tp + j) for j in range(tp)) for i in range(count)]
+
+
+def _rendezvous_score(key: str, index: int) -> bytes:
+    return hashlib.blake2b(f"{key}:{index}".encode("utf-8"), digest_size=8).digest()
+
+
+class EnginePool(EngineBackend):
+    """
+    Runs ENGINE_REPLICAS independent engines, each in its own engine server
+    process (engine_server.py) with its own device set, and routes requests
+    between them.
+
+    Routing prefers, for requests with an affinity key (chat conversation or
+    session), the replica that served the key before (rendezvous hashing),
+    so its prefix cache is warm, as long as that replica has a free slot.
+    Otherwise the replica with the fewest in-flight tokens is chosen.
+
+    A monitor task health-checks every replica. A replica that crashes or stops
+    answering is restarted; only the streams it was serving fail. Replicas can
+    also be drained (no new requests) and restarted gracefully.
+
+    With ENGINE_BACKEND=simulated the replicas are CPU-only stand-ins.
+    """
+
+    _replicas: List[Replica] = None
+    _monitor: Optional[asyncio.Task] = None
+    # Replicas (engine servers) already send coalesced frames
+    coalesce = False
+    _connecting: Optional[asyncio.Task] = None
+    _background: set = None
+
+    @classmethod
+    def _create_scheduler(cls) -> AdmissionScheduler:
+        # Each replica runs MAX_IN_FLIGHT sequences
+        return AdmissionScheduler(max_in_flight=config.MAX_IN_FLIGHT * config.ENGINE_REPLICAS)
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._replicas is not None
+
+    @property
+    def replicas(self) -> List[Replica]:
+        return self._replicas or []
+
+    def initialize(self):
+        """Starts every replica and waits until they are all serving."""
+        if self._replicas is not None:
+            return
+
+        socket_dir = config.ENGINE_SOCKET_DIR or os.path.join(tempfile.gettempdir(), f"localai-{os.getpid()}")
+        os.makedirs(socket_dir, exist_ok=True)
+        devices = replica_devices(config.ENGINE_REPLICAS)
+        replicas = [
+            Replica(i, devices[i], os.path.join(socket_dir, f"replica-{i}.sock"))
+            for i in range(config.ENGINE_REPLICAS)
+        ]
+
+        print(f"🔄 Starting {len(replicas)} {config.ENGINE_BACKEND} engine replicas...")
+        for replica in replicas:
+            self._spawn(replica)
+        for replica in replicas:
+            wait_until_serving(replica.process, replica.socket_path)
+        self._replicas = replicas
+        self._background = set()
+        print(f"✅ Engine pool ready ({len(replicas)} replicas).")
+
+    def shutdown(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for replica in self.replicas:
+            if replica.connection is not None:
+                replica.connection.close()
+            self._terminate(replica)
+
+    # --------------------------------------------------------------------------
+    # Replica processes
+    # --------------------------------------------------------------------------
+
+    def _spawn(self, replica: Replica):
+        replica.process = launch(replica.socket_path, {"ENGINE_REPLICAS": "1", "CUDA_VISIBLE_DEVICES": replica.devices})
+        replica.state = STATE_STARTING
+        replica.ping_failures = 0
+        replica.started_at = time.monotonic()
+
+    @staticmethod
+    def _terminate(replica: Replica, timeout: float = 10):
+        process = replica.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    async def _connect(self, replica: Replica):
+        """Connects to a started replica and marks it ready."""
+        connection = EngineConnection(replica.socket_path)
+        await connection.connect()
+        replica.connection = connection
+        replica.state = STATE_READY
+        print(f"✅ Engine replica {replica.index} ready (devices {replica.devices}).")
+
+    async def _wait_until_serving(self, replica: Replica) -> bool:
+        """Waits for a (re)started replica's socket; False if the process exits first."""
+        while not os.path.exists(replica.socket_path):
+            if replica.process.poll() is not None:
+                return False
+            await asyncio.sleep(0.5)
+        await self._connect(replica)
+        return True
+
+    async def _restart(self, replica: Replica, reason: str):
+        """Replaces a replica's process. Streams on other replicas are untouched."""
+        if replica.restarting:
+            return
+        print(f"⚠️  Restarting engine replica {replica.index}: {reason}")
+        replica.restarting = True
+        replica.state = STATE_UNHEALTHY
+        try:
+            if replica.connection is not None:
+                # Fails the streams that were running on this replica
+                replica.connection.close()
+                replica.connection = None
+            await asyncio.to_thread(self._terminate, replica)
+            replica.restarts += 1
+            self._spawn(replica)
+            if not await self._wait_until_serving(replica):
+                replica.state = STATE_UNHEALTHY
+        except Exception as e:
+            print(f"Error restarting engine replica {replica.index}: {e}")
+            replica.state = STATE_UNHEALTHY
+        finally:
+            replica.restarting = False
+
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _ensure_started(self):
+        """Connects to the replicas and starts the health monitor on first use (needs the event loop)."""
+        if self._connecting is None:
+            self._connecting = asyncio.create_task(self._connect_all())
+        await asyncio.shield(self._connecting)
+
+    async def _connect_all(self):
+        # The monitor runs whatever happens below, so replicas that fail to connect get restarted
+        self._monitor = asyncio.create_task(self._monitor_loop())
+        pending = [replica for replica in self._replicas if replica.connection is None]
+        results = await asyncio.gather(*(self._connect(replica) for replica in pending), return_exceptions=True)
+        for replica, result in zip(pending, results):
+            if isinstance(result, Exception):
+                # Only this replica is out of rotation; the others serve requests
+                print(f"⚠️  Failed to connect to engine replica {replica.index}: {result}")
+                replica.state = STATE_UNHEALTHY
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.sleep(config.REPLICA_HEALTH_INTERVAL)
+            for replica in self._replicas:
+                if replica.restarting:
+                    continue
+                if replica.state == STATE_UNHEALTHY:
+                    # The last restart failed; try again
+                    self._run_in_background(self._restart(replica, "previous restart failed"))
+                    continue
+                if replica.process.poll() is not None:
+                    self._run_in_background(self._restart(replica, f"process exited with code {replica.process.returncode}"))
+                    continue
+                self._run_in_background(self._check(replica))
+
+    async def _check(self, replica: Replica):
+        try:
+            if replica.connection is None:
+                raise ConnectionError("not connected")
+            stats = await replica.connection.ping(timeout=config.REPLICA_HEALTH_INTERVAL)
+        except (ConnectionError, asyncio.TimeoutError):
+            replica.ping_failures += 1
+            if replica.ping_failures >= MAX_PING_FAILURES:
+                await self._restart(replica, f"{replica.ping_failures} failed health checks")
+            return
+        replica.ping_failures = 0
+        replica.queue_depth = stats.get("queue_depth", 0)
+
+    # --------------------------------------------------------------------------
+    # Draining
+    # --------------------------------------------------------------------------
+
+    def _replica(self, index: int) -> Replica:
+        if not 0 <= index < len(self.replicas):
+            raise IndexError(f"No engine replica {index}")
+        return self._replicas[index]
+
+    def drain(self, index: int):
+        """Stops routing new requests to a replica; in-flight requests finish normally."""
+        replica = self._replica(index)
+        if replica.state == STATE_READY:
+            replica.state = STATE_DRAINING
+
+    def undrain(self, index: int):
+        replica = self._replica(index)
+        if replica.state == STATE_DRAINING:
+            replica.state = STATE_READY
+
+    async def restart_replica(self, index: int):
+        """Drains a replica, waits for its requests to finish (up to REPLICA_DRAIN_TIMEOUT) and restarts it."""
+        replica = self._replica(index)
+        self.drain(index)
+        deadline = time.monotonic() + config.REPLICA_DRAIN_TIMEOUT
+        while replica.active > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        await self._restart(replica, "requested")
+
+    # --------------------------------------------------------------------------
+    # Routing
+    # --------------------------------------------------------------------------
+
+    def _pick(self, affinity_key: Optional[str]) -> Optional[Replica]:
+        candidates = [replica for replica in self._replicas if replica.routable]
+        if not candidates:
+            return None
+        if affinity_key is not None:
+            # Rendezvous hashing: stable across processes and only remaps keys of replicas that go away
+            preferred = max(candidates, key=lambda r: _rendezvous_score(affinity_key, r.index))
+            if preferred.active < config.MAX_IN_FLIGHT:
+                return preferred
+        return min(candidates, key=lambda r: (r.active_tokens, r.queue_depth, r.active))
+
+    async def _generate(
+        self,
+        prompt: Union[str, List[int]],
+        sampling: SamplingConfig,
+        request_id: str,
+        affinity_key: Optional[str] = None,
+        priority: int = 0,
+        background: bool = False,
+    ) -> AsyncIterator[EngineOutput]:
+        await self._ensure_started()
+        replica = self._pick(affinity_key)
+        if replica is None:
+            raise RuntimeError("No healthy engine replicas")
+
+        cost = (len(prompt) if isinstance(prompt, list) else len(prompt) // 4) + sampling.max_tokens * sampling.n
+        stream = replica.connection.generate(prompt, sampling, request_id, priority, background)
+        replica.active += 1
+        replica.active_tokens += cost
+        try:
+            async for output in stream:
+                yield output
+        finally:
+            replica.active -= 1
+            replica.active_tokens -= cost
+            # Closing the stream early aborts the request on the replica
+            await stream.aclose()
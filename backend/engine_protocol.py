@@ -0,0 +1,150 @@
+import asyncio
+import json
+import math
+import struct
+from array import array
+from typing import List, Optional, Tuple, Union
+
+# ------------------------------------------------------------------------------
+# Engine IPC Protocol
+# ------------------------------------------------------------------------------
+#
+# Engine servers (engine_server.py) and their clients exchange length-prefixed
+# binary frames over a local stream socket:
+#
+#     [u32 payload length][u8 message type][payload]
+#
+# Token IDs travel as packed uint32 arrays (native byte order: both ends run
+# on the same host) and output frames carry only the newly generated tokens,
+# so a streamed delta costs a few dozen bytes and no JSON work. JSON is used
+# only for the (rare) control payloads.
+
+MSG_GENERATE = 1  # client -> server: start a request
+MSG_ABORT = 2     # client -> server: stop a request
+MSG_OUTPUT = 3    # server -> client: one EngineOutput delta
+MSG_ERROR = 4     # server -> client: a request failed
+MSG_PING = 5      # client -> server: health check
+MSG_PONG = 6      # server -> client: health check reply with load stats
+MSG_END = 7       # server -> client: a request's outputs are complete
+
+_FRAME_HEADER = struct.Struct("!IB")
+_REQUEST_ID = struct.Struct("!16s")
+# request_id, prompt is tokens (bool), options JSON length
+_GENERATE_HEADER = struct.Struct("!16s?I")
+# request_id, sample index, prompt_tokens, cached_tokens (-1 = not set),
+# cumulative logprob (NaN = not set), finish reason length, token count
+_OUTPUT_HEADER = struct.Struct("!16sHiidBI")
+
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends a malformed frame."""
+
+
+def _frame(msg_type: int, payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(len(payload), msg_type) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Reads one frame. Raises asyncio.IncompleteReadError when the peer closes the connection."""
+    length, msg_type = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame too large ({length} bytes)")
+    return msg_type, await reader.readexactly(length)
+
+
+def encode_generate(request_id: str, prompt: Union[str, List[int]], options: dict) -> bytes:
+    """
+    Args:
+        request_id (str): 32 hex characters (uuid4().hex).
+        prompt (str | List[int]): Prompt text or token IDs.
+        options (dict): Sampling parameters and routing hints (JSON-serializable).
+    """
+    is_tokens = isinstance(prompt, list)
+    options = json.dumps(options, separators=(",", ":")).encode("utf-8")
+    body = array("I", prompt).tobytes() if is_tokens else prompt.encode("utf-8")
+    return _frame(MSG_GENERATE, _GENERATE_HEADER.pack(bytes.fromhex(request_id), is_tokens, len(options)) + options + body)
+
+
+def decode_generate(payload: bytes) -> Tuple[str, Union[str, List[int]], dict]:
+    raw_id, is_tokens, options_len = _GENERATE_HEADER.unpack_from(payload)
+    start = _GENERATE_HEADER.size
+    options = json.loads(payload[start:start + options_len])
+    body = payload[start + options_len:]
+    if is_tokens:
+        prompt = array("I")
+        prompt.frombytes(body)
+        prompt = prompt.tolist()
+    else:
+        prompt = body.decode("utf-8")
+    return raw_id.hex(), prompt, options
+
+
+def encode_abort(request_id: str) -> bytes:
+    return _frame(MSG_ABORT, _REQUEST_ID.pack(bytes.fromhex(request_id)))
+
+
+def decode_request_id(payload: bytes) -> str:
+    return _REQUEST_ID.unpack_from(payload)[0].hex()
+
+
+def encode_output(request_id: str, text: str, token_ids: List[int], finish_reason: Optional[str],
+                  prompt_tokens: Optional[int], cached_tokens: Optional[int],
+                  index: int = 0, cumulative_logprob: Optional[float] = None) -> bytes:
+    finish = (finish_reason or "").encode("ascii")
+    header = _OUTPUT_HEADER.pack(
+        bytes.fromhex(request_id),
+        index,
+        -1 if prompt_tokens is None else prompt_tokens,
+        -1 if cached_tokens is None else cached_tokens,
+        math.nan if cumulative_logprob is None else cumulative_logprob,
+        len(finish),
+        len(token_ids),
+    )
+    return _frame(MSG_OUTPUT, header + finish + array("I", token_ids).tobytes() + text.encode("utf-8"))
+
+
+def decode_output(payload: bytes) -> Tuple[str, str, List[int], Optional[str], Optional[int], Optional[int], int, Optional[float]]:
+    """Returns (request_id, text, token_ids, finish_reason, prompt_tokens, cached_tokens, index, cumulative_logprob)."""
+    raw_id, index, prompt_tokens, cached_tokens, cumulative_logprob, finish_len, n_tokens = _OUTPUT_HEADER.unpack_from(payload)
+    offset = _OUTPUT_HEADER.size
+    finish_reason = payload[offset:offset + finish_len].decode("ascii") or None
+    offset += finish_len
+    token_ids = array("I")
+    token_ids.frombytes(payload[offset:offset + 4 * n_tokens])
+    text = payload[offset + 4 * n_tokens:].decode("utf-8")
+    return (
+        raw_id.hex(),
+        text,
+        token_ids.tolist(),
+        finish_reason,
+        None if prompt_tokens < 0 else prompt_tokens,
+        None if cached_tokens < 0 else cached_tokens,
+        index,
+        None if math.isnan(cumulative_logprob) else cumulative_logprob,
+    )
+
+
+def encode_end(request_id: str) -> bytes:
+    return _frame(MSG_END, _REQUEST_ID.pack(bytes.fromhex(request_id)))
+
+
+def encode_error(request_id: str, error: dict) -> bytes:
+    return _frame(MSG_ERROR, _REQUEST_ID.pack(bytes.fromhex(request_id)) + json.dumps(error).encode("utf-8"))
+
+
+def decode_error(payload: bytes) -> Tuple[str, dict]:
+    return decode_request_id(payload), json.loads(payload[_REQUEST_ID.size:])
+
+
+def encode_ping() -> bytes:
+    return _frame(MSG_PING, b"")
+
+
+def encode_pong(stats: dict) -> bytes:
+    return _frame(MSG_PONG, json.dumps(stats).encode("utf-8"))
+
+
+def decode_pong(payload: bytes) -> dict:
+    return json.loads(payload)
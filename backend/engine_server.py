@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+import config
+import engine_protocol as protocol
+from engine_base import EngineBackend, get_engine
+from scheduler import AdmissionRejected
+
+# ------------------------------------------------------------------------------
+# Engine Server
+# ------------------------------------------------------------------------------
+#
+# Runs one engine (vLLM or simulated) in its own process and serves it over a
+# Unix socket using the binary framing in engine_protocol.py. Engine replicas
+# started by the EnginePool, and the shared engine behind multi-worker API
+# servers (API_WORKERS > 1), are engine servers:
+#
+#     python engine_server.py --socket /tmp/localai/replica-0.sock
+
+SERVER_SCRIPT = os.path.abspath(__file__)
+
+
+def launch(socket_path: str, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """
+    Starts an engine server process listening on `socket_path`.
+    `env` overrides environment variables (i.e. config) for the server. It exits if this process does.
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    return subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--socket", socket_path, "--parent-pid", str(os.getpid())],
+        # The server runs the engine itself, never another remote engine
+        env=dict(os.environ, ENGINE_SERVER_SOCKET="", **(env or {})),
+    )
+
+
+def wait_until_serving(process: subprocess.Popen, socket_path: str):
+    """Blocks until a launched server is listening (after its engine has loaded)."""
+    while not os.path.exists(socket_path):
+        if process.poll() is not None:
+            raise RuntimeError(f"Engine server exited during startup (code {process.returncode})")
+        time.sleep(0.1)
+
+
+async def handle_connection(engine: EngineBackend, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serves one client connection; requests on it are multiplexed by request ID."""
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(request_id: str, prompt, options: dict):
+        try:
+            slot = await engine.scheduler.acquire(
+                priority=options.get("priority", 0),
+                timeout=options.get("queue_timeout"),
+                background=options.get("background", False),
+            )
+            async for output in engine.generate(prompt, slot=slot, affinity_key=options.get("affinity_key"), **options.get("sampling", {})):
+                writer.write(protocol.encode_output(
+                    request_id, output.text, output.token_ids, output.finish_reason,
+                    output.prompt_tokens, output.cached_tokens, output.index, output.cumulative_logprob,
+                ))
+                await writer.drain()
+            # Ends the client's stream even if a sample never reported a finish reason
+            writer.write(protocol.encode_end(request_id))
+        except asyncio.CancelledError:
+            # Aborted by the client (engine.generate() aborts the engine request on the way out)
+            pass
+        except AdmissionRejected as e:
+            writer.write(protocol.encode_error(request_id, {"error": str(e), "reason": e.reason, "retry_after": e.retry_after}))
+        except Exception as e:
+            print(f"Error in engine server request {request_id}: {e}")
+            writer.write(protocol.encode_error(request_id, {"error": str(e)}))
+        finally:
+            tasks.pop(request_id, None)
+
+    try:
+        while True:
+            msg_type, payload = await protocol.read_frame(reader)
+            if msg_type == protocol.MSG_GENERATE:
+                request_id, prompt, options = protocol.decode_generate(payload)
+                tasks[request_id] = asyncio.create_task(run(request_id, prompt, options))
+            elif msg_type == protocol.MSG_ABORT:
+                task = tasks.get(protocol.decode_request_id(payload))
+                if task is not None:
+                    task.cancel()
+            elif msg_type == protocol.MSG_PING:
+                writer.write(protocol.encode_pong({
+                    "backend": config.ENGINE_BACKEND,
+                    "in_flight": engine.scheduler.in_flight,
+                    "queue_depth": engine.scheduler.queue_depth,
+                }))
+            else:
+                raise protocol.ProtocolError(f"Unexpected message type {msg_type}")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except protocol.ProtocolError as e:
+        print(f"Warning: Closing engine client connection: {e}")
+    finally:
+        # The client is gone: stop everything it started
+        for task in list(tasks.values()):
+            task.cancel()
+        writer.close()
+
+
+async def _exit_with_parent(parent_pid: int, server: asyncio.AbstractServer):
+    """Stops the server if the process that started it (the engine pool) goes away."""
+    while os.getppid() == parent_pid:
+        await asyncio.sleep(1)
+    print("⚠️  Engine pool process exited; stopping engine server.")
+    server.close()
+
+
+async def serve(socket_path: str, parent_pid: Optional[int] = None):
+    engine = get_engine()
+    engine.initialize()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(lambda r, w: handle_connection(engine, r, w), path=socket_path)
+    os.chmod(socket_path, 0o600)
+    print(f"✅ Engine server listening on {socket_path} (pid {os.getpid()}).")
+    if parent_pid is not None:
+        asyncio.create_task(_exit_with_parent(parent_pid, server))
+    async with server:
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            engine.shutdown()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the inference engine over a Unix socket.")
+    parser.add_argument("--socket", required=True, help="Path of the Unix socket to listen on")
+    parser.add_argument("--parent-pid", type=int, help="Exit when this process (the engine pool) exits")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.socket, args.parent_pid))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,54 @@
+import json
+from json.encoder import encode_basestring_ascii
+from typing import AsyncIterator, Dict, Optional
+
+# ------------------------------------------------------------------------------
+# Stream Frame Encoding
+# ------------------------------------------------------------------------------
+#
+# Streams send one small JSON object per frame, so per-token serialization cost
+# adds up. The common frames ({"text": ...} deltas and {"type": ..., "text": ...}
+# Harmony events) are built from pre-encoded prefixes and the C string escaper
+# instead of a generic json.dumps() call. The output is byte-for-byte what
+# json.dumps() produces, so cached and live streams stay interchangeable.
+
+_TEXT_PREFIX = '{"text": '
+_INDEX_PREFIX = '{"index": '
+# Pre-encoded '{"type": "<type>", "text": ' per event type
+_EVENT_PREFIXES: Dict[str, str] = {}
+
+
+def text_frame(text: str, index: Optional[int] = None) -> str:
+    """A completion delta: {"text": ...}, or {"index": i, "text": ...} for requests with n > 1."""
+    if index is None:
+        return _TEXT_PREFIX + encode_basestring_ascii(text) + "}\n"
+    return _INDEX_PREFIX + str(index) + ', "text": ' + encode_basestring_ascii(text) + "}\n"
+
+
+def event_frame(event: dict, index: Optional[int] = None) -> str:
+    """
+    A Harmony stream event, with the sample "index" appended for requests with n > 1.
+    Events other than plain {"type", "text"} ones (e.g. tool calls) use json.dumps().
+    """
+    if len(event) != 2 or "text" not in event:
+        if index is not None:
+            event = {**event, "index": index}
+        return json.dumps(event) + "\n"
+    event_type = event["type"]
+    prefix = _EVENT_PREFIXES.get(event_type)
+    if prefix is None:
+        prefix = _EVENT_PREFIXES[event_type] = '{"type": ' + encode_basestring_ascii(event_type) + ', "text": '
+    suffix = "}\n" if index is None else ', "index": ' + str(index) + "}\n"
+    return prefix + encode_basestring_ascii(event["text"]) + suffix
+
+
+async def sse_events(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Re-frames an NDJSON stream as Server-Sent Events: one "data:" event per frame.
+    A chunk may hold several frames (e.g. a replayed cached response).
+    """
+    try:
+        async for chunk in stream:
+            yield "".join("data: " + line + "\n\n" for line in chunk.splitlines() if line)
+    finally:
+        await stream.aclose()
@@ -0,0 +1,176 @@
+from typing import Dict, Iterable, List, Optional
+from openai_harmony import HarmonyEncoding, Role, StreamableParser
+from engine_base import GenerationControl
+
+# ------------------------------------------------------------------------------
+# Harmony Stream Parsing
+# ------------------------------------------------------------------------------
+
+# Channel name -> event type sent to the client
+CHANNEL_EVENT_TYPES = {
+    "analysis": "reasoning",
+    "final": "content",
+    "commentary": "commentary",
+}
+
+
+class HarmonyStreamParser:
+    """
+    Incremental, token-level parser for assistant output in the Harmony format.
+
+    Wraps openai_harmony's StreamableParser, so channel state is tracked per token
+    instead of re-scanning a growing text buffer. Every call to `process()` returns
+    the events produced by that batch of tokens, with consecutive deltas of the
+    same kind merged into one event:
+
+        {"type": "reasoning", "text": "..."}                 analysis channel
+        {"type": "content", "text": "..."}                   final channel
+        {"type": "commentary", "text": "..."}                commentary channel (preambles)
+        {"type": "tool_call", "recipient": "...", "text": "..."}  message addressed to a tool
+
+    Multiple assistant messages (e.g. analysis -> tool call -> final) are handled
+    in sequence. If the token stream is malformed the parser degrades to emitting
+    the decoded text as content rather than dropping it.
+    """
+
+    def __init__(self, encoding: HarmonyEncoding):
+        self._encoding = encoding
+        self._parser = StreamableParser(encoding, role=Role.ASSISTANT, strict=False)
+        self._failed = False
+
+    @staticmethod
+    def _event_for(channel: Optional[str], recipient: Optional[str]) -> Dict[str, str]:
+        if recipient:
+            return {"type": "tool_call", "recipient": recipient, "text": ""}
+        return {"type": CHANNEL_EVENT_TYPES.get(channel, "content"), "text": ""}
+
+    def process(self, token_ids: Iterable[int]) -> List[Dict[str, str]]:
+        """
+        Feeds generated token IDs to the parser.
+
+        Returns:
+            List[dict]: Events for the content produced by these tokens.
+        """
+        events: List[Dict[str, str]] = []
+        parts: List[str] = []
+        current: Optional[Dict[str, str]] = None
+        current_key = None
+        parser = self._parser
+
+        for token in token_ids:
+            if self._failed:
+                delta = self._fallback_text(token)
+                channel, recipient = None, None
+            else:
+                try:
+                    parser.process(token)
+                except Exception as e:
+                    print(f"Warning: Harmony stream parsing failed, falling back to raw text: {e}")
+                    self._failed = True
+                    delta = self._fallback_text(token)
+                    channel, recipient = None, None
+                else:
+                    delta = parser.last_content_delta
+                    if not delta:
+                        continue
+                    channel, recipient = parser.current_channel, parser.current_recipient
+
+            if not delta:
+                continue
+
+            # Start a new event when the channel or recipient changes
+            if current is None or (channel, recipient) != current_key:
+                if current is not None:
+                    current["text"] = "".join(parts)
+                    events.append(current)
+                current, current_key, parts = self._event_for(channel, recipient), (channel, recipient), []
+            parts.append(delta)
+
+        if current is not None:
+            current["text"] = "".join(parts)
+            events.append(current)
+        return events
+
+    def finish(self):
+        """Signals the end of the stream so a trailing message is closed."""
+        if not self._failed:
+            try:
+                self._parser.process_eos()
+            except Exception:
+                pass
+
+    def _fallback_text(self, token: int) -> str:
+        if self._encoding.is_special_token(token):
+            return ""
+        return self._encoding.decode([token])
+
+
+# Appended to the sequence to close the analysis message and open the final answer
+FINAL_CHANNEL_SWITCH = "<|end|><|start|>assistant<|channel|>final<|message|>"
+
+
+class HarmonyControl(GenerationControl):
+    """
+    Harmony-aware stop conditions and reasoning budget for one assistant turn.
+
+    Tracks the message structure from special token IDs alone (the header text is
+    decoded only when a message starts), so it costs a set lookup per token:
+
+    - Once a final-channel message ends, `stop` is set: nothing after the answer
+      is decoded, even if the model doesn't emit <|return|>.
+    - When more than `analysis_budget` tokens have been spent in the analysis
+      channel, the analysis message is closed and the final channel is opened by
+      forcing FINAL_CHANNEL_SWITCH into the sequence.
+    """
+
+    def __init__(self, encoding: HarmonyEncoding, analysis_budget: Optional[int] = None):
+        self._encoding = encoding
+        self.analysis_budget = analysis_budget
+        self.analysis_tokens = 0
+        self.forced_final = False
+        self.stop = False
+
+        def token(text: str) -> int:
+            return encoding.encode(text, allowed_special="all")[0]
+
+        self._start = token("<|start|>")
+        self._message = token("<|message|>")
+        self._message_ends = {token("<|end|>"), token("<|return|>"), token("<|call|>")}
+        self._switch = encoding.encode(FINAL_CHANNEL_SWITCH, allowed_special="all")
+        # The prompt ends with "<|start|>assistant", so output begins in a message header
+        self._header: List[int] = []
+        self._channel: Optional[str] = None
+        self._in_content = False
+
+    def _parse_channel(self) -> Optional[str]:
+        text = self._encoding.decode(self._header)
+        if "<|channel|>" not in text:
+            return None
+        channel = text.split("<|channel|>", 1)[1].split("<|", 1)[0].split()
+        return channel[0] if channel else None
+
+    def observe(self, token_ids: List[int]) -> Optional[List[int]]:
+        for token in token_ids:
+            if self._in_content:
+                if token in self._message_ends:
+                    self._in_content = False
+                    self._header = []
+                    if self._channel == "final":
+                        self.stop = True
+                        return None
+                elif self._channel == "analysis":
+                    self.analysis_tokens += 1
+            elif token == self._message:
+                self._channel = self._parse_channel()
+                self._in_content = True
+            elif token == self._start:
+                self._header = []
+            else:
+                self._header.append(token)
+
+        if (self.analysis_budget and not self.forced_final and self._in_content
+                and self._channel == "analysis" and self.analysis_tokens >= self.analysis_budget):
+            self.forced_final = True
+            self._channel = "final"
+            return list(self._switch)
+        return None
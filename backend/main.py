@@ -1,16 +1,22 @@
 import uvicorn
 import os
+import tempfile
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Load environment variables from .env file (if it exists)
 load_dotenv(dotenv_path="../.env")
 
+# Imported first: startup phase timings count from here
+from startup import STATE_FAILED, startup
 import config
-from engine import LLMEngine
-from routers import completion, chat
+from metrics import loop_lag_monitor, metrics
+from prep_executor import shutdown_prep_executor
+from response_cache import get_response_cache
+from routers import completion, chat, sessions, replicas, batch, stream
 
 # ------------------------------------------------------------------------------
 # Lifecycle Management
@@ -20,16 +26,24 @@ from routers import completion, chat
 async def lifespan(app: FastAPI):
     """
     Handle startup and shutdown events.
-    Initializes the LLM engine when the server starts.
+    Loads and warms up the LLM engine when the server starts: in the background
+    (BACKGROUND_LOAD), or before the server accepts requests.
     """
-    # 1. Initialize the LLM Engine (loads model into GPU memory)
-    engine = LLMEngine()
-    engine.initialize()
+    # 1. Watch for callbacks that block the event loop (and so delay every stream)
+    loop_lag_monitor.start()
+
+    # 2. Load the Harmony encoding and the LLM engine (model into GPU memory), then warm up
+    startup.start()
+    if not config.BACKGROUND_LOAD:
+        await startup.wait()
     
     yield
     
-    # (Optional) Clean up resources on shutdown if needed
+    # Clean up resources on shutdown (e.g. stop engine replica processes)
     print("Shutting down API server...")
+    loop_lag_monitor.stop()
+    shutdown_prep_executor()
+    await startup.shutdown()
 
 # ------------------------------------------------------------------------------
 # API Setup
@@ -58,18 +72,105 @@ app.add_middleware(
 async def health_check():
     """
     Simple health check endpoint to verify the server is running.
+    'ready' tells whether the model is loaded and warmed up.
+    """
+    return {"status": "active", "model": config.MODEL_NAME, "backend": config.ENGINE_BACKEND, "ready": startup.ready, "startup": startup.state}
+
+@app.get("/health/live")
+async def liveness():
+    """
+    Liveness probe: 200 while the process serves requests, even while the model loads.
+    503 only if startup failed, so the orchestrator restarts the process.
+    """
+    report = startup.report()
+    return JSONResponse(report, status_code=503 if startup.state == STATE_FAILED else 200)
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once the engine is loaded and warmed up, 503 before that.
+    The body reports the startup state, phase timings and warm-up progress.
+    """
+    report = {"model": config.MODEL_NAME, "backend": config.ENGINE_BACKEND, **startup.report()}
+    return JSONResponse(report, status_code=200 if startup.ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Latency and throughput metrics in the Prometheus text format, split by endpoint and reasoning effort.
     """
-    return {"status": "active", "model": config.MODEL_NAME}
+    # Before the engine is loaded there is nothing in flight
+    scheduler = startup.engine.scheduler if startup.engine is not None else None
+    body = metrics.render({
+        "localai_in_flight": ("Sequences currently being generated.", scheduler.in_flight if scheduler else 0),
+        "localai_queue_depth": ("Requests waiting for an engine slot.", scheduler.queue_depth if scheduler else 0),
+        "localai_event_loop_lag_max_seconds": ("Worst event loop lag since the previous scrape.", loop_lag_monitor.take_max()),
+        "localai_ready": ("1 once the engine is loaded and warmed up.", int(startup.ready)),
+        "localai_startup_seconds": ("Seconds from process start until ready (0 while starting).", round(startup.timings.get("total", 0), 3)),
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Response cache hit/miss counters (the cache is opt-in via RESPONSE_CACHE_ENABLED).
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
 
 # Register Routers
 app.include_router(completion.router, prefix="/completion", tags=["Completion"])
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
+app.include_router(sessions.router, prefix="/sessions", tags=["Sessions"])
+app.include_router(replicas.router, prefix="/replicas", tags=["Replicas"])
+app.include_router(batch.router, prefix="/batch", tags=["Batch"])
+app.include_router(stream.router, prefix="/ws", tags=["Streaming"])
 
 # ------------------------------------------------------------------------------
 # Entry Point
 # ------------------------------------------------------------------------------
 
+def run_workers():
+    """
+    Runs API_WORKERS uvicorn worker processes in front of one engine server process.
+
+    The workers handle HTTP, JSON and Harmony work on their own cores and stream
+    token deltas from the engine server over a Unix socket. If ENGINE_SERVER_SOCKET
+    is set, an engine server that is already running there is used instead.
+    """
+    import engine_server
+
+    server = None
+    socket_path = config.ENGINE_SERVER_SOCKET
+    if not socket_path:
+        socket_dir = os.path.join(tempfile.gettempdir(), f"localai-{os.getpid()}")
+        os.makedirs(socket_dir, exist_ok=True)
+        socket_path = os.path.join(socket_dir, "engine.sock")
+        print(f"🔄 Starting engine server ({config.ENGINE_BACKEND}) at {socket_path}...")
+        # Every worker admits up to MAX_IN_FLIGHT requests; the server queues them all
+        queue_size = config.API_WORKERS * config.MAX_IN_FLIGHT + config.MAX_QUEUE_SIZE
+        server = engine_server.launch(socket_path, {"MAX_QUEUE_SIZE": str(queue_size)})
+        engine_server.wait_until_serving(server, socket_path)
+
+    # Worker processes inherit these settings
+    os.environ["ENGINE_SERVER_SOCKET"] = socket_path
+    if config.SESSION_STORE == "memory":
+        print("ℹ️  Using SESSION_STORE=disk so that sessions are shared between workers.")
+        os.environ["SESSION_STORE"] = "disk"
+
+    print(f"Starting {config.API_WORKERS} API workers on {config.HOST}:{config.PORT}")
+    try:
+        uvicorn.run("main:app", host=config.HOST, port=config.PORT, workers=config.API_WORKERS)
+    finally:
+        if server is not None:
+            server.terminate()
+
 if __name__ == "__main__":
-    print(f"Starting server on {config.HOST}:{config.PORT} with auto-reload enabled")
-    # Use "main:app" string to enable reload
-    uvicorn.run("main:app", host=config.HOST, port=config.PORT, reload=True)
+    if config.API_WORKERS > 1:
+        run_workers()
+    else:
+        print(f"Starting server on {config.HOST}:{config.PORT} with auto-reload enabled")
+        # Use "main:app" string to enable reload
+        uvicorn.run("main:app", host=config.HOST, port=config.PORT, reload=True)
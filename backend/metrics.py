@@ -0,0 +1,291 @@
+import asyncio
+import bisect
+import json
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import config
+
+# ------------------------------------------------------------------------------
+# Metrics and Request Tracing
+# ------------------------------------------------------------------------------
+
+# Bucket upper bounds (the +Inf bucket is implicit)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.25, 0.5)
+TOKEN_COUNT_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+Labels = Tuple[str, ...]  # (endpoint, reasoning_effort), or () for process-wide series
+LABEL_NAMES = ("endpoint", "reasoning_effort")
+
+
+class Histogram:
+    """A cumulative histogram per label set, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_str = _format_labels(labels)
+            bucket_prefix = label_str + "," if label_str else ""
+            series_labels = f"{{{label_str}}}" if label_str else ""
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{self.name}_bucket{{{bucket_prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{series_labels} {total:.6f}")
+            lines.append(f"{self.name}_count{series_labels} {count}")
+        return lines
+
+
+def _format_labels(labels: Labels) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in zip(LABEL_NAMES, labels))
+
+
+class Metrics:
+    """Process-wide request metrics, observed once per request when its trace finishes."""
+
+    def __init__(self):
+        self.ttft = Histogram("localai_time_to_first_token_seconds", "Time from request start to the first generated token.", LATENCY_BUCKETS)
+        self.itl = Histogram("localai_inter_token_latency_seconds", "Mean time between generated tokens, per request.", TOKEN_LATENCY_BUCKETS)
+        self.e2e = Histogram("localai_e2e_latency_seconds", "Time from request start to the end of the stream.", LATENCY_BUCKETS)
+        self.queue_wait = Histogram("localai_queue_wait_seconds", "Time spent waiting for an engine slot.", LATENCY_BUCKETS)
+        self.prompt_tokens = Histogram("localai_prompt_tokens", "Prompt length in tokens.", TOKEN_COUNT_BUCKETS)
+        self.completion_tokens = Histogram("localai_completion_tokens", "Generated tokens per request.", TOKEN_COUNT_BUCKETS)
+        self.tokens_per_second = Histogram("localai_tokens_per_second", "Decode throughput per request.", THROUGHPUT_BUCKETS)
+        self.loop_lag = Histogram("localai_event_loop_lag_seconds", "How late the event loop ran a periodic timer (time other callbacks held the loop).", LOOP_LAG_BUCKETS)
+        self.histograms = (self.ttft, self.itl, self.e2e, self.queue_wait, self.prompt_tokens, self.completion_tokens, self.tokens_per_second, self.loop_lag)
+        # (endpoint, reasoning_effort, finish_reason) -> count
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+
+    def observe(self, trace: "RequestTrace"):
+        labels = (trace.endpoint, trace.reasoning_effort)
+        key = labels + (trace.finish_reason or "none",)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        self.e2e.observe(labels, trace.finished_at - trace.started_at)
+        if trace.queue_wait is not None:
+            self.queue_wait.observe(labels, trace.queue_wait)
+        if trace.first_token_at is None:
+            return
+        self.ttft.observe(labels, trace.first_token_at - trace.started_at)
+        self.prompt_tokens.observe(labels, trace.prompt_tokens)
+        self.completion_tokens.observe(labels, trace.completion_tokens)
+        decode_time = trace.last_token_at - trace.first_token_at
+        if trace.completion_tokens > 1 and decode_time > 0:
+            self.itl.observe(labels, decode_time / (trace.completion_tokens - 1))
+            self.tokens_per_second.observe(labels, (trace.completion_tokens - 1) / decode_time)
+
+    def render(self, gauges: Dict[str, Tuple[str, float]]) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+
+        Args:
+            gauges (dict): name -> (help text, value) for point-in-time values
+                (in-flight sequences, queue depth) read at scrape time.
+        """
+        lines = []
+        for name, (help_text, value) in gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+        lines += ["# HELP localai_requests_total Finished requests.", "# TYPE localai_requests_total counter"]
+        for (endpoint, effort, finish_reason), count in sorted(self.requests.items()):
+            lines.append(f'localai_requests_total{{{_format_labels((endpoint, effort))},finish_reason="{finish_reason}"}} {count}')
+
+        for histogram in self.histograms:
+            lines += histogram.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: a task sleeps for LOOP_LAG_INTERVAL seconds and
+    records how much later than that it actually wakes up. Lag is time during
+    which some callback held the loop (e.g. synchronous prompt preparation), and
+    every active stream's tokens were delayed by as much.
+    """
+
+    def __init__(self, interval: float = config.LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        # Worst lag since the last scrape
+        self._max_lag = 0.0
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def take_max(self) -> float:
+        """Returns the worst lag seen since the previous call and resets it."""
+        lag, self._max_lag = self._max_lag, 0.0
+        return lag
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            metrics.loop_lag.observe((), lag)
+            self._max_lag = max(self._max_lag, lag)
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+class RequestTrace:
+    """
+    Per-request stage timings and token counts.
+
+    Routers create a trace when a request arrives and `mark()` the end of each
+    preparation stage (parse, render, truncate); the engine records the queue
+    wait, first token and completion. Observing tokens costs one clock read per
+    frame. When the request ends, `finish()` records it in `metrics` and, if
+    enabled, writes a structured log line from the background log thread.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        # As sent by clients ("low", "medium", "high"), or "none" for completions
+        self.reasoning_effort = "none"
+        # Whether the client asked for the timings in the final status frame
+        self.include_timings = False
+        self.started_at = time.perf_counter()
+        self._last_mark = self.started_at
+        self.stages: Dict[str, float] = {}
+        self.queue_wait: Optional[float] = None
+        self.admitted_at = self.started_at
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.finish_reason: Optional[str] = None
+
+    def mark(self, stage: str):
+        """Records the time since the previous mark as `stage`."""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last_mark
+        self._last_mark = now
+
+    def add(self, stage: str, seconds: float):
+        """Adds time measured elsewhere (e.g. accumulated per frame) to `stage`."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def admitted(self, queue_wait: float):
+        self.queue_wait = queue_wait
+        self.admitted_at = time.perf_counter()
+        self.stages["queue"] = queue_wait
+
+    def on_output(self, output):
+        """Called for every EngineOutput frame."""
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+            self.stages["first_token"] = now - self.admitted_at
+            if output.prompt_tokens is not None:
+                self.prompt_tokens = output.prompt_tokens
+        self.last_token_at = now
+        self.completion_tokens += len(output.token_ids)
+        if output.finish_reason is not None:
+            self.finish_reason = output.finish_reason
+
+    def timings(self) -> Dict[str, float]:
+        """Stage durations in milliseconds."""
+        end = self.finished_at or time.perf_counter()
+        timings = {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        timings["total"] = round((end - self.started_at) * 1000, 3)
+        return timings
+
+    def finish(self):
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.perf_counter()
+        metrics.observe(self)
+        if config.TRACE_REQUESTS:
+            record = {
+                "event": "request",
+                "endpoint": self.endpoint,
+                "reasoning_effort": self.reasoning_effort,
+                "finish_reason": self.finish_reason,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "timings_ms": self.timings(),
+            }
+            background_log.submit(lambda: json.dumps(record))
+
+
+class BackgroundLog:
+    """
+    Writes log lines from a daemon thread.
+
+    Callers submit a callable that builds the line, so formatting (JSON encoding,
+    detokenizing prompts) also happens off the event loop. If the queue backs up,
+    new lines are dropped rather than slowing requests down.
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self._queue: "queue.Queue[Callable[[], str]]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def submit(self, build_line: Callable[[], str]):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="background-log", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(build_line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            build_line = self._queue.get()
+            try:
+                print(build_line(), flush=True)
+            except Exception as e:
+                print(f"Warning: Failed to write log line: {e}")
+
+
+background_log = BackgroundLog()
+
+
+def log_prompt(endpoint: str, prompt, decode: Optional[Callable[[List[int]], str]] = None):
+    """
+    Logs a sample of prompts (PROMPT_LOG_SAMPLE_RATE) from the background log thread.
+    Token ID prompts are decoded with `decode` in that thread, not on the event loop.
+    """
+    if config.PROMPT_LOG_SAMPLE_RATE <= 0 or random.random() >= config.PROMPT_LOG_SAMPLE_RATE:
+        return
+
+    def build_line() -> str:
+        text = decode(prompt) if decode is not None and isinstance(prompt, list) else prompt
+        return json.dumps({"event": "prompt", "endpoint": endpoint, "prompt": text})
+
+    background_log.submit(build_line)
@@ -0,0 +1,72 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional, TypeVar
+import config
+
+# ------------------------------------------------------------------------------
+# Request Preparation Executor
+# ------------------------------------------------------------------------------
+
+MODE_INLINE = "inline"    # Run on the event loop
+MODE_THREAD = "thread"    # Thread pool: enough when the work releases the GIL or is split into small calls
+MODE_PROCESS = "process"  # Process pool: full isolation, each worker keeps its own caches
+MODES = (MODE_INLINE, MODE_THREAD, MODE_PROCESS)
+
+T = TypeVar("T")
+
+
+class PrepExecutor:
+    """
+    Runs CPU-heavy request preparation (Harmony rendering, tokenization,
+    truncation) outside the event loop, so one large conversation doesn't
+    stall token delivery for every other stream.
+
+    At most `max_pending` jobs are queued or running; further requests wait
+    for a free spot (backpressure) instead of piling up in the pool.
+    """
+
+    def __init__(self, mode: str = config.PREP_EXECUTOR, workers: int = config.PREP_WORKERS, max_pending: int = config.PREP_MAX_PENDING):
+        if mode not in MODES:
+            raise ValueError(f"Unknown PREP_EXECUTOR mode: {mode}")
+        self.mode = mode
+        self._pool: Optional[Executor] = None
+        if mode == MODE_THREAD:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prep")
+        elif mode == MODE_PROCESS:
+            # "spawn": forking a process that runs an event loop and threads isn't safe
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._pending: Optional[asyncio.Semaphore] = None
+        self._max_pending = max(1, max_pending)
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Runs `fn(*args, **kwargs)` in the pool (or inline) and returns its result."""
+        if self._pool is None:
+            return fn(*args, **kwargs)
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self._max_pending)
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[PrepExecutor] = None
+
+
+def get_prep_executor() -> PrepExecutor:
+    """Returns the process-wide preparation executor (created on first use)."""
+    global _executor
+    if _executor is None:
+        _executor = PrepExecutor()
+    return _executor
+
+
+def shutdown_prep_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
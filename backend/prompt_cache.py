@@ -0,0 +1,69 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Iterable, Optional
+import config
+
+# ------------------------------------------------------------------------------
+# Rendered Prompt Cache
+# ------------------------------------------------------------------------------
+
+EMPTY_PREFIX = b"\0" * 16
+
+
+def prefix_hash(previous: bytes, message_key: bytes) -> bytes:
+    """Chains a message key onto the hash of the conversation prefix before it."""
+    return hashlib.blake2b(previous + message_key, digest_size=16).digest()
+
+
+class RenderCache:
+    """
+    LRU cache of rendered Harmony token IDs, one entry per message.
+
+    Harmony renders every message independently (the prompt is the concatenation
+    of the rendered messages plus the assistant header), so a message's tokens
+    are cached under its content hash. Unlike keys derived from the whole prefix,
+    these stay valid when truncation drops older turns. Entries are stored as
+    compact uint32 arrays and the cache is bounded by the total number of tokens.
+    It is thread-safe, so prompts can be rendered from the preparation thread pool.
+    """
+
+    def __init__(self, max_tokens: int = config.RENDER_CACHE_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self._entries: "OrderedDict[bytes, array]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Number of tokens currently cached."""
+        return self._size
+
+    def get(self, key: bytes) -> Optional[array]:
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tokens
+
+    def put(self, key: bytes, token_ids: Iterable[int]) -> array:
+        tokens = array("I", token_ids)
+        if len(tokens) > self.max_tokens:
+            # Too large to cache; hand it back without storing
+            return tokens
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = tokens
+            self._size += len(tokens)
+            while self._size > self.max_tokens:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return tokens
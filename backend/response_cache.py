@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Tuple, Union
+import config
+
+# ------------------------------------------------------------------------------
+# Deterministic Response Cache
+# ------------------------------------------------------------------------------
+
+def is_cacheable(params: dict) -> bool:
+    """Only greedy (temperature=0) generations are deterministic enough to replay."""
+    return params.get("temperature") == 0
+
+
+class ResponseCache:
+    """
+    Caches complete NDJSON response streams for deterministic requests.
+
+    Entries are keyed on the endpoint, the rendered prompt (token IDs for /chat,
+    text for /completion) and the sampling parameters. The memory tier is an LRU
+    bounded by `max_bytes`; an optional disk tier keeps entries across restarts.
+    Both tiers expire entries after `ttl` seconds.
+    """
+
+    def __init__(self, max_bytes: int = config.RESPONSE_CACHE_MAX_BYTES, ttl: float = config.RESPONSE_CACHE_TTL,
+                 disk_dir: Optional[str] = config.RESPONSE_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(endpoint: str, prompt: Union[str, List[int]], params: dict) -> str:
+        """Builds the cache key for a request."""
+        payload = json.dumps([config.MODEL_NAME, endpoint, prompt, sorted(params.items())], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Returns the stored frames for `key`, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[0]):
+            self._evict(key)
+            entry = None
+        if entry is None and self.disk_dir:
+            entry = self._load(key)
+            if entry is not None:
+                self._store(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, frames: List[str]):
+        entry = (time.time(), frames)
+        self._store(key, entry)
+        if self.disk_dir:
+            self._save(key, entry)
+
+    def _store(self, key: str, entry: Tuple[float, List[str]]):
+        size = sum(len(frame) for frame in entry[1])
+        if size > self.max_bytes:
+            return
+        self._evict(key)
+        self._entries[key] = entry
+        self._sizes[key] = size
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self._total_bytes -= self._sizes.pop(key)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.ndjson")
+
+    def _load(self, key: str) -> Optional[Tuple[float, List[str]]]:
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return stored_at, f.read().splitlines(keepends=True)
+        except OSError:
+            return None
+
+    def _save(self, key: str, entry: Tuple[float, List[str]]):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(entry[1]))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Failed to write response cache entry: {e}")
+
+    async def record(self, key: str, stream: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+        """
+        Passes a response stream through and stores it once it completes.
+        Streams that end early (client disconnect, errors, deadlines) are not cached.
+        """
+        frames = []
+        try:
+            async for frame in stream:
+                frames.append(frame)
+                yield frame
+        finally:
+            # Close the chain right away when the consumer goes away (aborts the engine request)
+            await stream.aclose()
+
+        # Only cache streams that ended with a normal "done" frame
+        last = json.loads(frames[-1]) if frames else {}
+        if last.get("type") == "done" and last.get("finish_reason") in ("stop", "length"):
+            if "timings_ms" in last:
+                # Stage timings describe the request that produced the response, not later hits
+                del last["timings_ms"]
+                frames[-1] = json.dumps(last) + "\n"
+            self.put(key, frames)
+
+
+async def replay(frames: List[str]) -> AsyncGenerator[str, None]:
+    """Replays a cached stream in a single write."""
+    yield "".join(frames)
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns the process-wide response cache, or None if RESPONSE_CACHE_ENABLED is off."""
+    global _cache
+    if _cache is None and config.RESPONSE_CACHE_ENABLED:
+        _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,98 @@
+import json
+import os
+import re
+import tempfile
+from typing import AsyncIterator, BinaryIO, Optional
+from fastapi import APIRouter, Request, HTTPException
+from batch import BatchCheckpoint, run_batch
+from routers.common import ensure_ready, stream_response
+import config
+
+router = APIRouter()
+
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+# Jobs currently running in this process (a checkpoint has one writer)
+_running_jobs = set()
+
+# Request bodies above this size are spooled to a temporary file
+_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+
+async def _spool_body(request: Request) -> BinaryIO:
+    """
+    Reads the whole request body before the response starts (Starlette reads from
+    the same channel to detect client disconnects while streaming).
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    return body
+
+
+async def _body_lines(body: BinaryIO) -> AsyncIterator[str]:
+    for line in body:
+        yield line.decode("utf-8")
+
+
+@router.post("")
+async def batch_generate(
+    request: Request,
+    job_id: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    low_priority: bool = config.BATCH_LOW_PRIORITY,
+):
+    """
+    Batch endpoint.
+    Accepts a JSONL body of chat ('messages') and completion ('prompt') requests,
+    each with an optional 'id', and streams one JSONL result per request in
+    completion order, followed by a {"summary": ...} line.
+
+    Query parameters:
+        job_id: Makes the job resumable: finished IDs are checkpointed under
+            BATCH_DIR and skipped when the same job is posted again.
+        concurrency: Max requests of this job in flight (capped by BATCH_CONCURRENCY).
+        low_priority: Yield engine slots to interactive /chat and /completion requests.
+    """
+    ensure_ready()
+    concurrency = min(concurrency or config.BATCH_CONCURRENCY, config.BATCH_CONCURRENCY)
+    if concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be positive")
+    if job_id is not None:
+        if not _JOB_ID_RE.match(job_id):
+            raise HTTPException(status_code=400, detail="job_id may only contain letters, digits, '.', '_' and '-'")
+        if job_id in _running_jobs:
+            raise HTTPException(status_code=409, detail=f"Batch job {job_id} is already running")
+        # Claimed before the first await, so a concurrent post of the same job gets the 409
+        _running_jobs.add(job_id)
+
+    body = None
+    checkpoint = None
+
+    def close():
+        if body is not None:
+            body.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if job_id is not None:
+            _running_jobs.discard(job_id)
+
+    try:
+        body = await _spool_body(request)
+        if job_id is not None:
+            checkpoint = BatchCheckpoint(os.path.join(config.BATCH_DIR, f"{job_id}.done"))
+    except BaseException:
+        close()
+        raise
+
+    async def stream():
+        results = run_batch(_body_lines(body), concurrency, low_priority, checkpoint)
+        try:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+        finally:
+            # Stops the job's tasks before close() releases the body and checkpoint they use
+            await results.aclose()
+
+    # The job is released when the response ends, even if the client left before it started
+    return stream_response(stream(), headers={"X-Batch-Job": job_id} if job_id else None, on_close=close)
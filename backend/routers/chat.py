@@ -1,253 +1,356 @@
 import json
+import time
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
-from engine import LLMEngine
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse, Response
+from engine_base import EngineOutput, StreamStats, get_engine
+from frames import event_frame
+from routers.common import acquire_slot, ensure_ready, int_field, cache_lookup, collect_samples, request_timeout, sampling_params, stream_response, wants_sse, wants_stream
+from harmony_stream import HarmonyControl, HarmonyStreamParser
+from metrics import RequestTrace, log_prompt
+from context_budget import ContextBudgeter, ContextOverflow, FittedPrompt, STRATEGIES, message_key
+from prep_executor import MODE_INLINE, MODE_PROCESS, get_prep_executor
 import openai_harmony
-from openai_harmony import HarmonyEncodingName, Role, Author, TextContent, Message, Conversation, SystemContent, ReasoningEffort
+from typing import List, Optional
+from openai_harmony import HarmonyEncodingName, Role, Author, TextContent, Message, SystemContent, DeveloperContent, ReasoningEffort
 import config
 
 router = APIRouter()
 
-# Initialize Harmony encoder
-try:
-    enc = openai_harmony.load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
-except Exception as e:
-    print(f"Error loading openai_harmony: {e}")
-    enc = None
+# Harmony encoder, token-accurate history truncation and the tokens that end an
+# assistant turn (<|return|>, <|call|>; the engine stops on them). Set by load_harmony().
+enc = None
+budgeter: ContextBudgeter = None
+STOP_TOKEN_IDS: List[int] = []
+# Why the last load_harmony() call failed (None once the encoding is loaded)
+harmony_error: str = None
 
-async def filter_harmony_stream(upstream_generator):
+def load_harmony():
     """
-    Filters the stream and separates content into 'reasoning' (analysis) and 'content' (final).
-    Yields JSON chunks with {"type": "reasoning"|"content", "text": "..."}.
+    Loads the Harmony encoding (its vocab file may be downloaded on first use) and
+    the helpers built on it. Runs in the background at startup, not on import.
+
+    Returns:
+        The encoding, or None if it couldn't be loaded (the reason is in `harmony_error`).
     """
-    buffer = ""
-    
-    # States
-    STATE_WAITING = "waiting"
-    STATE_ANALYSIS = "analysis"
-    STATE_FINAL = "final"
-    current_state = STATE_WAITING
-
-    # Markers
-    ANALYSIS_MARKER = "<|channel|>analysis<|message|>"
-    FINAL_MARKER = "<|channel|>final<|message|>"
-    END_MARKER = "<|end|>"
-
-    async for chunk_json in upstream_generator:
-        # chunk_json is a JSON string: '{"text": "..."}\n'
-        try:
-            data = json.loads(chunk_json)
-            chunk_text = data.get("text", "")
-        except Exception:
-            continue
-            
-        buffer += chunk_text
-        
-        while buffer:
-            if current_state == STATE_WAITING:
-                # Check for markers to switch state
-                if ANALYSIS_MARKER in buffer:
-                    _, buffer = buffer.split(ANALYSIS_MARKER, 1)
-                    current_state = STATE_ANALYSIS
-                elif FINAL_MARKER in buffer:
-                    _, buffer = buffer.split(FINAL_MARKER, 1)
-                    current_state = STATE_FINAL
-                else:
-                    # Keep buffering until we see a marker or buffer gets too large?
-                    # Ideally the model outputs a marker very early.
-                    # If we have a lot of text and no marker, maybe it's raw text (fallback)?
-                    # For now, let's assume it starts with a marker.
-                    # Optimization: if buffer is huge and no marker, maybe just yield it as content?
-                    if len(buffer) > 200: # Heuristic
-                         # Assume content if no marker found after 200 chars?
-                         # Or just wait. Let's wait.
-                         break 
-                    break
-
-            elif current_state == STATE_ANALYSIS:
-                # Look for end of analysis (which is usually start of final or end marker)
-                # Actually, analysis ends with <|end|>, then <|channel|>final...
-                # But sometimes it might jump.
-                # Let's look for END_MARKER.
-                if END_MARKER in buffer:
-                    content, buffer = buffer.split(END_MARKER, 1)
-                    if content:
-                        yield json.dumps({"type": "reasoning", "text": content}) + "\n"
-                    # After analysis end, we go back to waiting for next channel
-                    current_state = STATE_WAITING
-                else:
-                    # Check if FINAL_MARKER appeared without END_MARKER (unexpected but possible)
-                    if FINAL_MARKER in buffer:
-                         content, buffer = buffer.split(FINAL_MARKER, 1)
-                         if content:
-                             yield json.dumps({"type": "reasoning", "text": content}) + "\n"
-                         current_state = STATE_FINAL
-                    else:
-                        # Yield all safe buffer
-                        # We need to keep enough buffer to match the END_MARKER
-                        safe_len = len(buffer) - len(END_MARKER)
-                        if safe_len > 0:
-                            yield json.dumps({"type": "reasoning", "text": buffer[:safe_len]}) + "\n"
-                            buffer = buffer[safe_len:]
-                        break
-
-            elif current_state == STATE_FINAL:
-                if END_MARKER in buffer:
-                    content, buffer = buffer.split(END_MARKER, 1)
-                    if content:
-                        yield json.dumps({"type": "content", "text": content}) + "\n"
-                    # Done with this message turn usually
-                    current_state = STATE_WAITING
-                else:
-                    # Yield all safe buffer
-                    safe_len = len(buffer) - len(END_MARKER)
-                    if safe_len > 0:
-                        yield json.dumps({"type": "content", "text": buffer[:safe_len]}) + "\n"
-                        buffer = buffer[safe_len:]
-                    break
+    global enc, budgeter, STOP_TOKEN_IDS, harmony_error
+    if enc is not None:
+        return enc
+    try:
+        encoding = openai_harmony.load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+    except Exception as e:
+        print(f"Error loading openai_harmony: {e}")
+        harmony_error = str(e)
+        return None
+    budgeter = ContextBudgeter(encoding, build_harmony_messages)
+    STOP_TOKEN_IDS = list(encoding.stop_tokens_for_assistant_actions())
+    harmony_error = None
+    enc = encoding
+    return enc
 
-@router.post("")
-async def chat_generate(request: Request):
+def canonicalize_instructions(text: str) -> str:
+    """Normalizes whitespace so equivalent system prompts render to identical tokens."""
+    return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").strip().split("\n"))
+
+def build_harmony_messages(role_str: str, content_str: str, reasoning_effort: ReasoningEffort) -> List[Message]:
     """
-    Chat endpoint.
-    Accepts a JSON body with 'messages' (list of dicts) and optional sampling parameters.
-    Applies the model's chat template using openai_harmony and streams the response.
+    Converts a simple dict-style message to Harmony Messages.
+    Returns an empty list for unknown roles.
+
+    A system message becomes the canonical system header (SystemContent with only
+    the reasoning effort set, so it is identical for every request with the same
+    effort) followed by a developer message carrying the client's instructions.
+    Identical headers give identical token prefixes, which vLLM's prefix cache shares.
     """
-    if enc is None:
-        raise HTTPException(status_code=500, detail="Harmony encoding not initialized")
+    # Map role
+    try:
+        role_enum = Role(role_str)
+    except ValueError:
+        # Skip invalid roles
+        return []
 
-    data = await request.json()
-    raw_messages = data.get("messages")
-    reasoning_effort_str = data.get("reasoning_effort", config.DEFAULT_REASONING_EFFORT).lower()
-    
-    # Map string to enum
+    if role_enum == Role.SYSTEM:
+        messages = [Message.from_role_and_content(Role.SYSTEM, SystemContent.new().with_reasoning_effort(reasoning_effort))]
+        instructions = canonicalize_instructions(content_str or "")
+        if instructions:
+            messages.append(Message.from_role_and_content(Role.DEVELOPER, DeveloperContent.new().with_instructions(instructions)))
+        return messages
+
+    return [Message(
+        author=Author(role=role_enum),
+        content=[TextContent(text=content_str)]
+    )]
+
+def with_system_message(raw_messages: list) -> list:
+    """
+    Every conversation starts with the canonical system header, even when the client
+    sends no system message, so all prompts share the same cached prefix.
+    """
+    if not raw_messages or raw_messages[0].get("role") != "system":
+        return [{"role": "system", "content": ""}] + raw_messages
+    return raw_messages
+
+def fit_prompt(raw_messages: list, reasoning_effort: ReasoningEffort, reserve_tokens: int, strategy: str) -> FittedPrompt:
+    """Renders and truncates a prompt with this process's budgeter (entry point for preparation worker processes)."""
+    load_harmony()
+    return budgeter.fit(raw_messages, reasoning_effort, reserve_tokens=reserve_tokens, strategy=strategy)
+
+async def prepare_prompt(
+    raw_messages: list,
+    reasoning_effort: ReasoningEffort,
+    reserve_tokens: int,
+    strategy: str,
+    trace: RequestTrace,
+) -> FittedPrompt:
+    """
+    Renders and truncates the prompt in the preparation executor, so rendering a
+    long conversation doesn't stall the streams of other requests.
+    Short conversations are prepared inline, where a pool hand-off would cost more.
+    """
+    executor = get_prep_executor()
+    size = sum(len(raw.get("content") or "") for raw in raw_messages)
+    if executor.mode == MODE_INLINE or size < config.PREP_INLINE_MAX_CHARS:
+        return budgeter.fit(raw_messages, reasoning_effort, reserve_tokens=reserve_tokens, strategy=strategy, trace=trace)
+    if executor.mode == MODE_PROCESS:
+        # The trace stays here; the worker's render and truncate time is recorded as one stage
+        fitted = await executor.run(fit_prompt, raw_messages, reasoning_effort, reserve_tokens, strategy)
+        trace.mark("render")
+        return fitted
+    return await executor.run(budgeter.fit, raw_messages, reasoning_effort, reserve_tokens=reserve_tokens, strategy=strategy, trace=trace)
+
+async def filter_harmony_stream(outputs, on_complete=None, trace: RequestTrace = None, tag: bool = False):
+    """
+    Parses the engine's token stream and separates content into 'reasoning' (analysis),
+    'content' (final), 'commentary' and 'tool_call' events.
+    Yields JSON chunks such as {"type": "reasoning"|"content", "text": "..."},
+    followed by a final {"type": "done", ...} frame with token usage.
+
+    If `on_complete` is given, it is called with the accumulated (content, reasoning)
+    text once the stream ends, including when the client disconnects early, and
+    whether the stream finished (False if it was cut off before the done frame).
+    If `trace` is given, time spent parsing is recorded as the "filter" stage.
+    If `tag` is set (requests with n > 1), each sample is parsed separately, its
+    events carry the sample's "index", and `on_complete` receives sample 0.
+    """
+    parsers = {}
+    stats = StreamStats()
+    content_parts, reasoning_parts = [], []
+    finished = False
+
+    try:
+        async for output in outputs:
+            stats.update(output)
+            parser = parsers.get(output.index)
+            if parser is None:
+                parser = parsers[output.index] = HarmonyStreamParser(enc)
+            if trace is not None:
+                started = time.perf_counter()
+                events = parser.process(output.token_ids)
+                trace.add("filter", time.perf_counter() - started)
+            else:
+                events = parser.process(output.token_ids)
+            for event in events:
+                if on_complete is not None and output.index == 0:
+                    if event["type"] == "content":
+                        content_parts.append(event["text"])
+                    elif event["type"] == "reasoning":
+                        reasoning_parts.append(event["text"])
+                yield event_frame(event, output.index if tag else None)
+
+        for parser in parsers.values():
+            parser.finish()
+        finished = True
+        yield json.dumps(stats.done_event(trace)) + "\n"
+    finally:
+        try:
+            # Close the engine stream right away when the consumer goes away (aborts the request, frees its slot)
+            await outputs.aclose()
+        finally:
+            if on_complete is not None:
+                on_complete("".join(content_parts), "".join(reasoning_parts), finished)
+
+class HarmonySampleBuilder:
+    """Parses one chat sample for a non-streaming response (final answer and reasoning)."""
+
+    def __init__(self):
+        self.parser = HarmonyStreamParser(enc)
+        self.content_parts: List[str] = []
+        self.reasoning_parts: List[str] = []
+
+    def add(self, output: EngineOutput):
+        for event in self.parser.process(output.token_ids):
+            if event["type"] == "content":
+                self.content_parts.append(event["text"])
+            elif event["type"] == "reasoning":
+                self.reasoning_parts.append(event["text"])
+
+    def result(self) -> dict:
+        self.parser.finish()
+        return {"content": "".join(self.content_parts), "reasoning": "".join(self.reasoning_parts)}
+
+def parse_reasoning_effort(value: str) -> ReasoningEffort:
+    """Maps a reasoning effort string to the Harmony enum (defaults to LOW)."""
     reasoning_effort_map = {
         "low": ReasoningEffort.LOW,
         "medium": ReasoningEffort.MEDIUM,
         "high": ReasoningEffort.HIGH
     }
-    reasoning_effort = reasoning_effort_map.get(reasoning_effort_str, ReasoningEffort.LOW)
+    return reasoning_effort_map.get((value or "").lower(), ReasoningEffort.LOW)
 
-    if not raw_messages or not isinstance(raw_messages, list):
-        return {"error": "Messages list is required"}
+def reasoning_budget(data: dict, reasoning_effort: ReasoningEffort, max_tokens: int) -> Optional[int]:
+    """
+    Max analysis-channel tokens for a request: the body field 'reasoning_budget' or
+    the budget for its reasoning effort. A budget leaves at least
+    REASONING_ANSWER_RESERVE tokens of max_tokens for the final answer.
 
-    # Context Management: Truncate history if too long
-    # Heuristic: 1 token ~= 4 chars.
-    max_chars = config.MAX_CONTEXT_TOKENS * 4
-    
-    # Identify system message (usually first) to preserve it
-    system_msg = None
-    if raw_messages and raw_messages[0].get("role") == "system":
-        system_msg = raw_messages.pop(0)
-        max_chars -= len(system_msg.get("content", ""))
-
-    # Truncate remaining messages from the front
-    while raw_messages:
-        total_chars = sum(len(m.get("content", "")) for m in raw_messages)
-        if total_chars <= max_chars:
-            break
-        raw_messages.pop(0) # Remove oldest non-system message
-
-    # Re-insert system message
-    if system_msg:
-        raw_messages.insert(0, system_msg)
-
-    # Convert simple dict messages to Harmony objects
-    harmony_messages = []
-    for msg in raw_messages:
-        role_str = msg.get("role")
-        content_str = msg.get("content")
-        
-        if not role_str or not content_str:
-            continue
-
-        # Map role
-        try:
-            role_enum = Role(role_str)
-        except ValueError:
-            # Fallback or skip invalid roles
-            continue
-
-        # Create Harmony Message
-        if role_enum == Role.SYSTEM:
-            # Use SystemContent for system messages to support reasoning effort
-            # Note: with_text might not be the method, looking at standard builder pattern often used
-            # If with_text doesn't exist, I'll rely on inspecting results. 
-            # But SystemContent.new() usually creates a builder.
-            # Let's assume .with_instructions(text) or .with_text(text)
-            # Based on DeveloperContent example in search: DeveloperContent.new().with_instructions(...)
-            # SystemContent likely has similar. Let's try .with_instructions() if it mimics DeveloperContent
-            # Or just check if SystemContent(text) works? No, it's a struct.
-            # I will guess .with_instructions() or .with_content()
-            # Actually, the search example showed: Message.from_role_and_content(Role.SYSTEM, SystemContent.new())
-            # It didn't show setting text for SystemContent in that snippet.
-            # But typically system message has text.
-            # I'll use a safer approach: try to find the method or use a generic TextContent if I can't set it.
-            # But I need reasoning effort.
-            # Let's assume .with_text() or .with_value() is common.
-            # To be safe, I'll use TextContent for now if I can't be sure, BUT I really want reasoning effort.
-            # Let's try SystemContent.new().with_text(content_str) and .with_reasoning_effort(...)
-            # If this fails, I'll catch it.
-            try:
-                 content_obj = SystemContent.new()
-                 # Try to find a way to set text. 
-                 # If I can't find it, I will just set the reasoning effort on an empty system message? That's useless.
-                 # Wait, maybe SystemContent IS the text container?
-                 # Let's search 'SystemContent' usage online? 
-                 # Time is short. I will assume TextContent is fine for content, 
-                 # and ReasoningEffort is set on the Conversation or System message specifically?
-                 # The grep showed 'with_reasoning_effort' in 'SystemContent'.
-                 # So SystemContent definitely has it.
-                 # Does SystemContent hold text?
-                 # `DeveloperContent` does `with_instructions`.
-                 # Let's try `with_instructions` for SystemContent too.
-                 if hasattr(content_obj, "with_instructions"):
-                     content_obj = content_obj.with_instructions(content_str)
-                 elif hasattr(content_obj, "with_text"):
-                     content_obj = content_obj.with_text(content_str)
-                 
-                 content_obj = content_obj.with_reasoning_effort(reasoning_effort)
-                 harmony_msg = Message(author=Author(role=role_enum), content=[content_obj])
-            except Exception as e:
-                print(f"Warning: Failed to construct SystemContent: {e}")
-                # Fallback
-                harmony_msg = Message(
-                    author=Author(role=role_enum),
-                    content=[TextContent(text=content_str)]
-                )
-        else:
-            harmony_msg = Message(
-                author=Author(role=role_enum),
-                content=[TextContent(text=content_str)]
-            )
-        harmony_messages.append(harmony_msg)
-
-    conversation = Conversation(messages=harmony_messages)
-
-    # Generate prompt using Harmony
-    # render_conversation_for_completion prepares the prompt for the model to continue (as assistant)
-    prompt = enc.render_conversation_for_completion(conversation, next_turn_role=Role.ASSISTANT)
-    
-    print(f"DEBUG: Generated Harmony Prompt: {prompt!r}")
-
-    # Extract optional parameters
-    params = {
-        "temperature": data.get("temperature"),
-        "max_tokens": data.get("max_tokens"),
-        "top_p": data.get("top_p"),
-        "skip_special_tokens": False # Important: We need special tokens to parse the stream
-    }
-    params = {k: v for k, v in params.items() if v is not None}
+    Returns:
+        int | None: The budget, or None when it is 0 (no limit, the default).
+    """
+    budget = int_field(data, "reasoning_budget", None)
+    if budget is None:
+        budget = {
+            ReasoningEffort.LOW: config.REASONING_BUDGET_LOW,
+            ReasoningEffort.MEDIUM: config.REASONING_BUDGET_MEDIUM,
+            ReasoningEffort.HIGH: config.REASONING_BUDGET_HIGH,
+        }[reasoning_effort]
+    if budget < 0:
+        raise HTTPException(status_code=400, detail="reasoning_budget must not be negative")
+    if not budget:
+        return None
+    max_tokens = min(max_tokens, config.MAX_TOKENS_LIMIT)
+    limit = max(max_tokens - config.REASONING_ANSWER_RESERVE, max_tokens // 2)
+    return min(budget, limit)
 
-    engine = LLMEngine()
-    
-    if engine.is_busy:
-        raise HTTPException(status_code=429, detail="Server is busy generating another response. Please wait.")
+def conversation_key(raw_messages: list) -> str:
+    """Identifies a conversation across turns by its first user message."""
+    for raw in raw_messages:
+        if raw.get("role") == "user" and raw.get("content"):
+            return message_key("user", raw["content"], ReasoningEffort.LOW).hex()
+    return None
+
+async def replay_chat(frames: list, on_complete=None):
+    """Replays a cached chat stream, reporting its content to `on_complete` like a live stream."""
+    yield "".join(frames)
+    if on_complete is not None:
+        events = [json.loads(frame) for frame in frames]
+        on_complete(
+            "".join(e["text"] for e in events if e.get("type") == "content"),
+            "".join(e["text"] for e in events if e.get("type") == "reasoning"),
+            True,
+        )
+
+async def stream_chat(
+    request: HTTPConnection,
+    data: dict,
+    raw_messages: list,
+    reasoning_effort: ReasoningEffort,
+    trace: RequestTrace,
+    on_complete=None,
+    affinity_key: str = None,
+) -> Response:
+    """
+    Renders `raw_messages`, admits the request and streams the parsed response
+    (or returns it as one JSON object if the body sets 'stream': false).
+    Shared by the stateless /chat endpoint, the /sessions endpoints and the /ws transport.
+
+    Args:
+        request (HTTPConnection): The incoming request or WebSocket (used for cache and Accept headers).
+        data (dict): The request body (sampling parameters, n, best_of, priority, context_strategy, ...).
+        raw_messages (list): The conversation as {"role", "content"} dicts.
+        reasoning_effort (ReasoningEffort): Applied to the system message.
+        trace (RequestTrace): Stage timings for this request (started by the endpoint).
+        on_complete: Optional callback receiving the final (content, reasoning) text
+            (of sample 0 when the request asks for several) and whether the response finished.
+        affinity_key (str): Routes the conversation to the same engine replica each turn
+            (defaults to a hash of the first user message).
+    """
+    ensure_ready()
+    if enc is None:
+        raise HTTPException(status_code=500, detail="Harmony encoding not initialized")
+
+    trace.reasoning_effort = reasoning_effort.value.lower()
+    trace.include_timings = bool(data.get("trace"))
+    trace.mark("parse")
+
+    # Extract optional parameters (unset values use the defaults)
+    params, n = sampling_params(data)
+    # The stream is parsed from token IDs, so the engine doesn't need to detokenize
+    params["detokenize"] = False
+    params["stop_token_ids"] = STOP_TOKEN_IDS
+    streaming = wants_stream(data)
+    timeout = request_timeout(data)
+    budget = reasoning_budget(data, reasoning_effort, params["max_tokens"])
+
+    raw_messages = with_system_message(raw_messages)
+
+    # Context Management: keep as much history as fits, leaving room for the output
+    strategy = data.get("context_strategy", config.CONTEXT_STRATEGY)
+    if strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"context_strategy must be one of {list(STRATEGIES)}")
+    # The prompt is assembled from cached per-message token IDs, so only new
+    # messages are rendered. Token IDs go straight to the engine (no re-tokenization).
+    try:
+        fitted = await prepare_prompt(
+            raw_messages,
+            reasoning_effort,
+            reserve_tokens=params["max_tokens"],
+            strategy=strategy,
+            trace=trace,
+        )
+    except ContextOverflow as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    prompt = fitted.token_ids
+    log_prompt(trace.endpoint, prompt, enc.decode)
+
+    # Deterministic streaming requests may be served from the response cache
+    cache, cache_key, frames = cache_lookup(request, "chat", prompt, {**params, "reasoning_budget": budget}) if streaming else (None, None, None)
+    if frames is not None:
+        return stream_response(replay_chat(frames, on_complete), headers={"X-Cache": "HIT"}, sse=wants_sse(request))
+
+    engine = get_engine()
+
+    # Wait for a free slot (or fail fast with 429 if the queue is full)
+    slot = await acquire_slot(engine, data)
     
     # Wrap the engine generator with our filter
-    filtered_stream = filter_harmony_stream(engine.generate_stream(prompt, **params))
+    if affinity_key is None:
+        affinity_key = conversation_key(raw_messages)
+    # Stops after the final answer and enforces the reasoning budget (single-sample requests)
+    control = HarmonyControl(enc, budget)
+    outputs = engine.generate(prompt, slot=slot, timeout=timeout, trace=trace, affinity_key=affinity_key, control=control, **params)
+    if not streaming:
+        response = await collect_samples(outputs, n, HarmonySampleBuilder, trace)
+        if on_complete is not None:
+            sample = response["samples"][0] if response["samples"] else {"content": "", "reasoning": ""}
+            on_complete(sample["content"], sample["reasoning"], True)
+        return JSONResponse(response)
+    filtered_stream = filter_harmony_stream(outputs, on_complete, trace, tag=params.get("n", 1) > 1)
+    headers = {}
+    if cache is not None:
+        filtered_stream = cache.record(cache_key, filtered_stream)
+        headers["X-Cache"] = "MISS"
+
+    # The engine request is aborted if the client disconnects
+    return stream_response(filtered_stream, slot, headers, sse=wants_sse(request))
+
+@router.post("")
+async def chat_generate(request: Request):
+    """
+    Chat endpoint.
+    Accepts a JSON body with 'messages' (list of dicts) and optional sampling parameters.
+    Applies the model's chat template using openai_harmony and streams the response
+    ('n', 'best_of', 'seed' and 'stream': false work as for /completion).
+    """
+    trace = RequestTrace("/chat")
+    data = await request.json()
+    return await chat_response(request, data, trace)
+
+async def chat_response(request: HTTPConnection, data: dict, trace: RequestTrace):
+    """Runs a chat request body (shared by POST /chat and the /ws transport)."""
+    raw_messages = data.get("messages")
+    reasoning_effort = parse_reasoning_effort(data.get("reasoning_effort", config.DEFAULT_REASONING_EFFORT))
+
+    if not raw_messages or not isinstance(raw_messages, list):
+        return {"error": "Messages list is required"}
 
-    return StreamingResponse(
-        filtered_stream,
-        media_type="application/x-ndjson"
-    )
\ No newline at end of file
+    return await stream_chat(request, data, raw_messages, reasoning_effort, trace)
@@ -0,0 +1,277 @@
+from typing import AsyncIterator, Callable, List, Optional, Tuple, Union
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.requests import HTTPConnection
+from starlette.types import Receive, Scope, Send
+from engine_base import EngineOutput, StreamStats
+from frames import sse_events
+from metrics import RequestTrace
+from response_cache import ResponseCache, get_response_cache, is_cacheable
+from scheduler import AdmissionRejected, Slot
+from startup import STATE_FAILED, startup
+import config
+
+
+def ensure_ready():
+    """Rejects generation requests with a 503 until the engine is loaded and warmed up."""
+    if not startup.ready:
+        detail = f"Server is not ready ({startup.state})"
+        if startup.state == STATE_FAILED:
+            raise HTTPException(status_code=503, detail=f"{detail}: {startup.error}")
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(config.STARTUP_RETRY_AFTER)})
+
+
+async def acquire_slot(engine, data: dict) -> Slot:
+    """
+    Admits a request through the engine's scheduler.
+
+    The optional body fields 'priority' (lower is served first) and
+    'queue_timeout' (seconds, capped by the server default) control queueing.
+    Raises a 429 with a Retry-After estimate if the request can't be admitted.
+    """
+    priority = int_field(data, "priority", 0)
+    timeout = float_field(data, "queue_timeout", None)
+    timeout = config.QUEUE_TIMEOUT if timeout is None else min(timeout, config.QUEUE_TIMEOUT)
+
+    try:
+        return await engine.scheduler.acquire(priority=priority, timeout=timeout)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def int_field(data: dict, name: str, default: Optional[int]) -> Optional[int]:
+    """Reads an optional integer field of a request body (400 if it isn't one)."""
+    value = data.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{name} must be an integer")
+
+
+def float_field(data: dict, name: str, default: Optional[float]) -> Optional[float]:
+    """Reads an optional numeric field of a request body (400 if it isn't one)."""
+    value = data.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{name} must be a number")
+
+
+def sampling_params(data: dict) -> Tuple[dict, int]:
+    """
+    Engine sampling parameters from a request body, with unset values left out so
+    the engine defaults apply. max_tokens is always set: DEFAULT_MAX_TOKENS unless
+    given, capped at MAX_TOKENS_LIMIT.
+
+    Besides temperature, top_p and max_tokens, a request may ask for 'n' samples
+    (generated in parallel from one prefill of the prompt), picked from 'best_of'
+    candidates by cumulative log probability, with an optional 'seed'.
+    best_of > n needs the whole candidates to rank them, so it requires stream=false.
+
+    Returns:
+        (params, n): the engine parameters (their 'n' is best_of) and the number of samples to return.
+    """
+    n = int_field(data, "n", 1)
+    best_of = int_field(data, "best_of", n)
+    if not 1 <= n <= config.MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"n must be between 1 and {config.MAX_SAMPLES}")
+    if not n <= best_of <= config.MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"best_of must be between n and {config.MAX_SAMPLES}")
+    if best_of > n and wants_stream(data):
+        raise HTTPException(status_code=400, detail="best_of > n requires stream=false")
+
+    max_tokens = int_field(data, "max_tokens", config.DEFAULT_MAX_TOKENS)
+    if max_tokens < 1:
+        raise HTTPException(status_code=400, detail="max_tokens must be at least 1")
+    temperature = float_field(data, "temperature", None)
+    if temperature is not None and temperature < 0:
+        raise HTTPException(status_code=400, detail="temperature must not be negative")
+    top_p = float_field(data, "top_p", None)
+    if top_p is not None and not 0 < top_p <= 1:
+        raise HTTPException(status_code=400, detail="top_p must be in (0, 1]")
+
+    params = {
+        "temperature": temperature,
+        "max_tokens": min(max_tokens, config.MAX_TOKENS_LIMIT),
+        "top_p": top_p,
+        "seed": int_field(data, "seed", None),
+    }
+    params = {k: v for k, v in params.items() if v is not None}
+    if best_of > 1:
+        params["n"] = best_of
+    if best_of > n:
+        # Candidates are ranked by the log probability of their sampled tokens
+        params["logprobs"] = 0
+    return params, n
+
+
+def wants_stream(data: dict) -> bool:
+    """Responses are streamed unless the body sets 'stream': false."""
+    return data.get("stream", True) is not False
+
+
+async def collect_samples(
+    outputs: AsyncIterator[EngineOutput],
+    n: int,
+    new_sample: Callable[[], "SampleBuilder"],
+    trace: Optional[RequestTrace] = None,
+) -> dict:
+    """
+    Runs a generation to completion and builds the non-streaming response.
+
+    Args:
+        outputs (AsyncIterator[EngineOutput]): The engine stream (possibly several interleaved samples).
+        n (int): Samples to return; with more candidates (best_of), the most likely ones are kept.
+        new_sample: Creates the builder that turns one sample's outputs into its response fields.
+        trace (RequestTrace | None): Adds stage timings if the request asked for them.
+
+    Returns:
+        dict: {"samples": [{"index", "finish_reason", "completion_tokens", ...}], "finish_reason",
+        "usage"} (plus "timings_ms"). "usage" counts the tokens of every candidate.
+    """
+    stats = StreamStats()
+    samples = {}
+    async for output in outputs:
+        stats.update(output)
+        sample = samples.get(output.index)
+        if sample is None:
+            sample = samples[output.index] = new_sample()
+        sample.add(output)
+
+    chosen = stats.best_samples(n) if len(stats.samples) > n else sorted(stats.samples)
+    results = []
+    for index, candidate in enumerate(chosen):
+        sample = samples.get(candidate) or new_sample()
+        results.append({**stats.sample_info(candidate), "index": index, **sample.result()})
+    response = stats.done_event(trace)
+    del response["type"]
+    response["samples"] = results
+    if results:
+        response["finish_reason"] = results[0]["finish_reason"]
+    return response
+
+
+class SampleBuilder:
+    """Accumulates the text of one completion sample for a non-streaming response."""
+
+    def __init__(self):
+        self.parts: List[str] = []
+
+    def add(self, output: EngineOutput):
+        self.parts.append(output.text)
+
+    def result(self) -> dict:
+        return {"text": "".join(self.parts)}
+
+
+def request_timeout(data: dict) -> Optional[float]:
+    """
+    Wall-clock deadline for generation, in seconds. The body field 'timeout'
+    can lower the server default (REQUEST_TIMEOUT, 0 = no deadline) but not raise it.
+    """
+    timeout = float_field(data, "timeout", None)
+    if timeout is None:
+        return config.REQUEST_TIMEOUT or None
+    if timeout <= 0:
+        raise HTTPException(status_code=400, detail="timeout must be positive")
+    return min(timeout, config.REQUEST_TIMEOUT) if config.REQUEST_TIMEOUT else timeout
+
+
+class EngineStreamingResponse(StreamingResponse):
+    """
+    NDJSON streaming response for engine output.
+
+    Starlette stops iterating the body when the client disconnects, but leaves
+    closing the generator chain to garbage collection. This response closes it
+    as soon as the response ends for any reason, so the engine request is
+    aborted right away instead of decoding until max_tokens. `on_close` then
+    runs, even if the body was never iterated (an unstarted generator's own
+    `finally` never runs).
+    """
+
+    def __init__(self, *args, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
+
+
+def wants_sse(request: HTTPConnection) -> bool:
+    """HTTP clients that send 'Accept: text/event-stream' get Server-Sent Events instead of NDJSON."""
+    return request.scope["type"] == "http" and "text/event-stream" in request.headers.get("accept", "")
+
+
+def stream_response(
+    stream: AsyncIterator[str],
+    slot: Optional[Slot] = None,
+    headers: Optional[dict] = None,
+    sse: bool = False,
+    on_close: Optional[Callable[[], None]] = None,
+) -> StreamingResponse:
+    """
+    Wraps an NDJSON stream in a response (or, with `sse`, a Server-Sent Events stream
+    carrying the same frames, for proxies and clients that only handle SSE).
+    The slot (if any) is freed and `on_close` is called once the response ends,
+    however it ends (including a disconnect before the stream starts, when
+    Starlette skips background tasks).
+    """
+    media_type = "application/x-ndjson"
+    if sse:
+        stream = sse_events(stream)
+        media_type = "text/event-stream"
+        # Keep proxies from buffering or caching the event stream
+        headers = {**(headers or {}), "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return EngineStreamingResponse(
+        stream,
+        media_type=media_type,
+        headers=headers,
+        on_close=_release_then(slot, on_close) if slot is not None else on_close,
+    )
+
+
+def _release_then(slot: Slot, on_close: Optional[Callable[[], None]]) -> Callable[[], None]:
+    def close():
+        # Idempotent: generate() usually released the slot already
+        slot.release()
+        if on_close is not None:
+            on_close()
+    return close
+
+
+def cache_bypassed(request: HTTPConnection) -> bool:
+    """Clients skip the response cache with 'Cache-Control: no-cache' or 'X-Cache-Bypass: 1'."""
+    if "no-cache" in request.headers.get("cache-control", "").lower():
+        return True
+    return request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes")
+
+
+def cache_lookup(request: HTTPConnection, endpoint: str, prompt: Union[str, List[int]], params: dict) -> Tuple[Optional[ResponseCache], Optional[str], Optional[List[str]]]:
+    """
+    Looks up a deterministic request in the response cache.
+
+    Returns:
+        (cache, key, frames): cache and key are None when the request isn't cacheable
+        (cache disabled, sampling not deterministic, or bypassed by the client);
+        frames is None on a miss.
+    """
+    cache = get_response_cache()
+    if cache is None or not is_cacheable(params) or cache_bypassed(request):
+        return None, None, None
+    key = cache.key(endpoint, prompt, params)
+    return cache, key, cache.get(key)
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
-from engine import LLMEngine
+from fastapi import APIRouter, Request
+from starlette.requests import HTTPConnection
+from engine_base import get_engine
+from metrics import RequestTrace, log_prompt
+from routers.common import SampleBuilder, acquire_slot, ensure_ready, cache_lookup, collect_samples, request_timeout, sampling_params, stream_response, wants_sse, wants_stream
+from response_cache import replay
 
 router = APIRouter()
 
@@ -8,33 +11,57 @@ router = APIRouter()
 async def completion_generate(request: Request):
     """
     Completion endpoint.
-    Accepts a JSON body with 'prompt' and optional sampling parameters.
-    Returns a streaming response (Server-Sent Events / NDJSON).
+    Accepts a JSON body with 'prompt' and optional sampling parameters
+    (including 'n', 'best_of' and 'seed').
+    Returns a streaming response (NDJSON, or Server-Sent Events with
+    'Accept: text/event-stream'), or one JSON object with every sample if
+    'stream' is false.
     """
+    trace = RequestTrace("/completion")
+
     # Parse the request body
     data = await request.json()
+    return await completion_response(request, data, trace)
+
+async def completion_response(request: HTTPConnection, data: dict, trace: RequestTrace):
+    """Runs a completion request body (shared by POST /completion and the /ws transport)."""
+    ensure_ready()
     prompt = data.get("prompt")
     
     if not prompt:
         return {"error": "Prompt is required"}
 
-    # Extract optional parameters
-    params = {
-        "temperature": data.get("temperature"),
-        "max_tokens": data.get("max_tokens"),
-        "top_p": data.get("top_p")
-    }
-    # Filter out None values to use defaults
-    params = {k: v for k, v in params.items() if v is not None}
+    # Extract optional parameters (unset values use the defaults)
+    params, n = sampling_params(data)
+    streaming = wants_stream(data)
+    trace.include_timings = bool(data.get("trace"))
+    trace.mark("parse")
+    log_prompt(trace.endpoint, prompt)
+
+    # Deterministic streaming requests may be served from the response cache
+    cache, cache_key, frames = cache_lookup(request, "completion", prompt, params) if streaming else (None, None, None)
+    if frames is not None:
+        return stream_response(replay(frames), headers={"X-Cache": "HIT"}, sse=wants_sse(request))
+
+    timeout = request_timeout(data)
 
     # Get the engine instance
-    engine = LLMEngine()
-    
-    if engine.is_busy:
-        raise HTTPException(status_code=429, detail="Server is busy generating another response. Please wait.")
-
-    # Return the streaming response using the engine's generator
-    return StreamingResponse(
-        engine.generate_stream(prompt, **params),
-        media_type="application/x-ndjson"
-    )
+    engine = get_engine()
+
+    # Wait for a free slot (or fail fast with 429 if the queue is full)
+    slot = await acquire_slot(engine, data)
+
+    if not streaming:
+        # All samples share one prefill and decode in the same batch
+        outputs = engine.generate(prompt, slot=slot, timeout=timeout, trace=trace, **params)
+        return await collect_samples(outputs, n, SampleBuilder, trace)
+
+    stream = engine.generate_stream(prompt, slot=slot, timeout=timeout, trace=trace, **params)
+    headers = {}
+    if cache is not None:
+        stream = cache.record(cache_key, stream)
+        headers["X-Cache"] = "MISS"
+
+    # Return the streaming response using the engine's generator.
+    # The engine request is aborted if the client disconnects.
+    return stream_response(stream, slot, headers, sse=wants_sse(request))
@@ -0,0 +1,56 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from startup import startup
+
+router = APIRouter()
+
+# Graceful restarts in progress (kept referenced until they finish)
+_restarts = set()
+
+def _pool():
+    """Returns the engine pool, or raises 404 if the server runs a single in-process engine."""
+    engine = startup.engine
+    if engine is None:
+        raise HTTPException(status_code=503, detail="The engine is still loading")
+    if not hasattr(engine, "replicas"):
+        raise HTTPException(status_code=404, detail="Not running an engine pool (ENGINE_REPLICAS=1)")
+    return engine
+
+@router.get("")
+async def list_replicas():
+    """Returns the state and load of every engine replica."""
+    return {"replicas": [replica.to_dict() for replica in _pool().replicas]}
+
+@router.post("/{index}/drain")
+async def drain_replica(index: int):
+    """Stops routing new requests to a replica. In-flight requests finish normally."""
+    pool = _pool()
+    try:
+        pool.drain(index)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return pool.replicas[index].to_dict()
+
+@router.post("/{index}/undrain")
+async def undrain_replica(index: int):
+    """Routes requests to a drained replica again."""
+    pool = _pool()
+    try:
+        pool.undrain(index)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return pool.replicas[index].to_dict()
+
+@router.post("/{index}/restart", status_code=202)
+async def restart_replica(index: int):
+    """
+    Drains a replica, lets its in-flight requests finish and restarts its process.
+    Returns immediately; poll GET /replicas for progress.
+    """
+    pool = _pool()
+    if not 0 <= index < len(pool.replicas):
+        raise HTTPException(status_code=404, detail=f"No engine replica {index}")
+    task = asyncio.create_task(pool.restart_replica(index))
+    _restarts.add(task)
+    task.add_done_callback(_restarts.discard)
+    return pool.replicas[index].to_dict()
@@ -0,0 +1,82 @@
+from fastapi import APIRouter, Request, HTTPException
+from starlette.requests import HTTPConnection
+from routers.chat import parse_reasoning_effort, stream_chat
+from metrics import RequestTrace
+from session_store import get_session_store
+import config
+
+router = APIRouter()
+
+@router.post("")
+async def create_session(request: Request):
+    """
+    Creates a conversation session.
+    Accepts an optional JSON body with 'system' (system prompt), 'reasoning_effort'
+    and 'messages' (existing history to seed the session with).
+    """
+    data = await request.json() if await request.body() else {}
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    messages = []
+    if data.get("system"):
+        messages.append({"role": "system", "content": data["system"]})
+    seed = data.get("messages") or []
+    if not isinstance(seed, list):
+        raise HTTPException(status_code=400, detail="messages must be a list")
+    for m in seed:
+        if not isinstance(m, dict) or not isinstance(m.get("role"), str) or not isinstance(m.get("content", ""), str):
+            raise HTTPException(status_code=400, detail="Each message must be an object with a 'role' and a string 'content'")
+        messages.append({"role": m["role"], "content": m.get("content") or ""})
+
+    reasoning_effort = parse_reasoning_effort(data.get("reasoning_effort", config.DEFAULT_REASONING_EFFORT)).value
+    session = get_session_store().create(reasoning_effort, messages)
+    return {"session_id": session.id, "reasoning_effort": session.reasoning_effort}
+
+@router.get("/{session_id}")
+async def get_session(session_id: str):
+    """Returns the stored history of a session."""
+    session = get_session_store().get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session.to_dict()
+
+@router.delete("/{session_id}")
+async def delete_session(session_id: str):
+    """Deletes a session."""
+    get_session_store().delete(session_id)
+    return {"deleted": session_id}
+
+@router.post("/{session_id}/messages")
+async def append_message(session_id: str, request: Request):
+    """
+    Appends a user message to a session and streams the assistant's reply.
+    Accepts a JSON body with 'content' and the same optional parameters as /chat.
+    The reply (final content and reasoning) is stored in the session when the stream ends.
+    """
+    trace = RequestTrace("/sessions")
+    data = await request.json()
+    return await session_response(request, session_id, data, trace)
+
+async def session_response(request: HTTPConnection, session_id: str, data: dict, trace: RequestTrace):
+    """Runs a session turn (shared by POST /sessions/{id}/messages and the /ws transport)."""
+    store = get_session_store()
+    session = store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+
+    content = data.get("content")
+    if not content:
+        raise HTTPException(status_code=400, detail="content is required")
+    if not isinstance(content, str):
+        raise HTTPException(status_code=400, detail="content must be a string")
+
+    raw_messages = session.messages + [{"role": "user", "content": content}]
+    reasoning_effort = parse_reasoning_effort(data.get("reasoning_effort", session.reasoning_effort))
+
+    def on_complete(reply: str, reasoning: str, finished: bool):
+        turn = [{"role": "user", "content": content}]
+        if reply or reasoning:
+            turn.append({"role": "assistant", "content": reply, "reasoning": reasoning, "truncated": not finished})
+        store.append_turn(session.id, turn)
+
+    return await stream_chat(request, data, raw_messages, reasoning_effort, trace, on_complete, affinity_key=session.id)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from metrics import RequestTrace
+from routers.chat import chat_response
+from routers.common import EngineStreamingResponse
+from routers.completion import completion_response
+from routers.sessions import session_response
+import config
+
+router = APIRouter()
+
+# ------------------------------------------------------------------------------
+# Multiplexed WebSocket Transport
+# ------------------------------------------------------------------------------
+#
+# One WebSocket carries many concurrent generations. Client messages (JSON):
+#
+#     {"op": "start", "id": "a", "endpoint": "chat", "body": {...}}
+#     {"op": "start", "id": "b", "endpoint": "sessions", "session_id": "...", "body": {...}, "credits": 32}
+#     {"op": "credit", "id": "b", "frames": 32}
+#     {"op": "cancel", "id": "a"}
+#
+# "endpoint" is "completion", "chat" or "sessions"; "body" is the request body of
+# that HTTP endpoint (always streamed). The server sends the same frames as the
+# HTTP stream, each with the stream's "id" added, e.g.
+#
+#     {"id": "a", "type": "content", "text": "..."}
+#     {"id": "a", "type": "done", "finish_reason": "stop", "usage": {...}}
+#     {"id": "a", "type": "error", "status": 429, "detail": "...", "retry_after": 2}
+#     {"id": "a", "type": "cancelled"}
+#
+# Every server message holds one or more newline-terminated frames. A stream
+# started with "credits" is flow controlled: the server sends at most that many
+# frames until the client grants more with "credit" messages.
+
+
+class _Stream:
+    """One generation on a multiplexed connection."""
+
+    def __init__(self, stream_id, credits: Optional[int]):
+        self.id = stream_id
+        # Pre-encoded start of every frame of this stream
+        self.prefix = '{"id": ' + json.dumps(stream_id) + ", "
+        self.credits = credits  # None = no flow control
+        self._credited = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def grant(self, frames: int):
+        if self.credits is not None:
+            self.credits += frames
+            self._credited.set()
+
+    async def take_credit(self):
+        while self.credits is not None and self.credits <= 0:
+            self._credited.clear()
+            await self._credited.wait()
+        if self.credits is not None:
+            self.credits -= 1
+
+
+def _frame(stream_id, **fields) -> str:
+    return json.dumps({"id": stream_id, **fields}) + "\n"
+
+
+async def _open(websocket: WebSocket, message: dict):
+    """Starts the generation for a "start" message through the HTTP endpoint's handler."""
+    endpoint = message.get("endpoint")
+    body = message.get("body")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="body must be a JSON object")
+    # Frames are forwarded as they are produced; use HTTP for non-streaming requests
+    body = {**body, "stream": True}
+    if endpoint == "completion":
+        return await completion_response(websocket, body, RequestTrace("/completion"))
+    if endpoint == "chat":
+        return await chat_response(websocket, body, RequestTrace("/chat"))
+    if endpoint == "sessions":
+        return await session_response(websocket, str(message.get("session_id")), body, RequestTrace("/sessions"))
+    raise HTTPException(status_code=400, detail="endpoint must be 'completion', 'chat' or 'sessions'")
+
+
+async def _run(websocket: WebSocket, stream: _Stream, message: dict, outgoing: asyncio.Queue):
+    """Forwards one generation's frames, tagged with its ID, honouring its credits."""
+    try:
+        response = await _open(websocket, message)
+        if not isinstance(response, EngineStreamingResponse):
+            # Validation errors the HTTP endpoints return as a JSON body
+            await outgoing.put(_frame(stream.id, type="error", status=400, detail=response.get("error")))
+            return
+        frames = response.body_iterator
+        try:
+            async for chunk in frames:
+                for line in chunk.splitlines():
+                    await stream.take_credit()
+                    await outgoing.put(stream.prefix + line[1:] + "\n")
+        finally:
+            # Aborts the engine request if the stream ended early (cancel, disconnect)
+            await frames.aclose()
+            if response.on_close is not None:
+                response.on_close()
+    except HTTPException as e:
+        fields = {"type": "error", "status": e.status_code, "detail": e.detail}
+        if e.headers and "Retry-After" in e.headers:
+            fields["retry_after"] = float(e.headers["Retry-After"])
+        await outgoing.put(_frame(stream.id, **fields))
+    except Exception as e:
+        await outgoing.put(_frame(stream.id, type="error", status=500, detail=str(e)))
+
+
+async def _write(websocket: WebSocket, outgoing: asyncio.Queue):
+    """Sends queued frames, packing whatever has accumulated into one message."""
+    while True:
+        frames = [await outgoing.get()]
+        while not outgoing.empty():
+            frames.append(outgoing.get_nowait())
+        await websocket.send_text("".join(frames))
+
+
+@router.websocket("")
+async def multiplex(websocket: WebSocket):
+    """
+    Multiplexed streaming endpoint: runs up to WS_MAX_STREAMS generations at once
+    over one WebSocket (see the protocol above). Closing the socket aborts them all.
+    """
+    await websocket.accept()
+    # Bounded: a slow reader pauses every stream instead of buffering without limit
+    outgoing: asyncio.Queue = asyncio.Queue(maxsize=config.WS_SEND_QUEUE)
+    streams: Dict[str, _Stream] = {}
+    writer = asyncio.create_task(_write(websocket, outgoing))
+
+    def start(message: dict, key: str):
+        credits = message.get("credits")
+        stream = _Stream(message.get("id"), None if credits is None else int(credits))
+        streams[key] = stream
+
+        async def run():
+            try:
+                await _run(websocket, stream, message, outgoing)
+            finally:
+                if streams.get(key) is stream:
+                    del streams[key]
+
+        stream.task = asyncio.create_task(run())
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                if not isinstance(message, dict):
+                    raise ValueError("not a JSON object")
+            except ValueError as e:
+                await outgoing.put(_frame(None, type="error", status=400, detail=f"Invalid message: {e}"))
+                continue
+
+            op = message.get("op")
+            stream_id = message.get("id")
+            key = json.dumps(stream_id)
+            stream = streams.get(key)
+            try:
+                if op == "start":
+                    if stream is not None:
+                        raise HTTPException(status_code=409, detail="A stream with this id is running")
+                    if len(streams) >= config.WS_MAX_STREAMS:
+                        raise HTTPException(status_code=429, detail=f"At most {config.WS_MAX_STREAMS} streams per connection")
+                    start(message, key)
+                elif op == "credit":
+                    if stream is not None:
+                        stream.grant(int(message.get("frames", 0)))
+                elif op == "cancel":
+                    if stream is not None:
+                        del streams[key]
+                        stream.task.cancel()
+                        await outgoing.put(_frame(stream_id, type="cancelled"))
+                else:
+                    raise HTTPException(status_code=400, detail="op must be 'start', 'credit' or 'cancel'")
+            except (TypeError, ValueError) as e:
+                await outgoing.put(_frame(stream_id, type="error", status=400, detail=str(e)))
+            except HTTPException as e:
+                await outgoing.put(_frame(stream_id, type="error", status=e.status_code, detail=e.detail))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        tasks = [stream.task for stream in streams.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        writer.cancel()
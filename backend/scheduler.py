@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import List, Optional, Tuple
+
+import config
+
+# ------------------------------------------------------------------------------
+# Admission Control
+# ------------------------------------------------------------------------------
+
+POLICY_FIFO = "fifo"
+POLICY_PRIORITY = "priority"
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted.
+
+    Attributes:
+        reason (str): "queue_full" or "deadline".
+        retry_after (int): Suggested number of seconds before retrying.
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request rejected ({reason}). Retry after {retry_after}s.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Slot:
+    """
+    A handle for one admitted sequence.
+    Releasing it is idempotent, so both the stream and a background task may call it.
+    """
+
+    def __init__(self, scheduler: "AdmissionScheduler", queue_wait: float, priority: int = 0, background: bool = False):
+        self._scheduler = scheduler
+        self._released = False
+        self.queue_wait = queue_wait
+        self.admitted_at = time.monotonic()
+        # How the request was admitted; forwarded to engine servers so their schedulers order it the same way
+        self.priority = priority
+        self.background = background
+
+    @property
+    def released(self) -> bool:
+        return self._released
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._scheduler._release(self)
+
+
+class AdmissionScheduler:
+    """
+    Bounds the number of sequences handed to the engine at once.
+
+    Up to `max_in_flight` requests run concurrently (vLLM batches them together).
+    Extra requests wait in a bounded queue, ordered FIFO or by priority
+    (lower value is served first, ties are FIFO). A request is rejected straight
+    away if the queue is full or if its deadline cannot be met given the
+    current queue depth.
+
+    Background requests (batch jobs) queue behind every interactive request,
+    whatever the policy, and don't count towards interactive requests' queue
+    limits or wait estimates. They never take the last `reserved_slots` slots,
+    so an interactive request arriving during a batch job starts right away.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = config.MAX_IN_FLIGHT,
+        max_queue: int = config.MAX_QUEUE_SIZE,
+        policy: str = config.SCHEDULER_POLICY,
+        reserved_slots: int = config.BATCH_RESERVED_SLOTS,
+    ):
+        if policy not in (POLICY_FIFO, POLICY_PRIORITY):
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.policy = policy
+        # Slots background requests may use
+        self.background_limit = max(1, self.max_in_flight - max(0, reserved_slots))
+        self._in_flight = 0
+        self._queue: List[Tuple[tuple, asyncio.Future]] = []
+        self._counter = itertools.count()
+        # Exponentially weighted average of how long a slot is held (seconds)
+        self._avg_service_time = config.SCHEDULER_INITIAL_SERVICE_TIME
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, waiter in self._queue if not waiter.done())
+
+    @property
+    def interactive_queue_depth(self) -> int:
+        """Waiting requests that aren't background requests."""
+        return sum(1 for key, waiter in self._queue if not key[0] and not waiter.done())
+
+    @property
+    def is_saturated(self) -> bool:
+        return self._in_flight >= self.max_in_flight
+
+    def estimate_wait(self, position: Optional[int] = None) -> float:
+        """
+        Estimates how long a request entering the queue at `position` will wait.
+        Each "round" of max_in_flight requests is assumed to take one average service time.
+        """
+        if position is None:
+            position = self.queue_depth
+        if not self.is_saturated and position == 0:
+            return 0.0
+        rounds = math.ceil((position + 1) / self.max_in_flight)
+        return rounds * self._avg_service_time
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait, based on the current queue depth."""
+        return max(1, math.ceil(self.estimate_wait()))
+
+    async def acquire(self, priority: int = 0, timeout: Optional[float] = None, background: bool = False) -> Slot:
+        """
+        Waits for a free slot.
+
+        Args:
+            priority (int): Lower values are served first (ignored by the FIFO policy).
+            timeout (float | None): Maximum seconds to wait in the queue.
+            background (bool): Only admit the request when no interactive request is waiting.
+
+        Returns:
+            Slot: Must be released once the generation is finished.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline can't be met.
+        """
+        enqueued_at = time.monotonic()
+
+        limit = self.background_limit if background else self.max_in_flight
+        if self._in_flight < limit and (self.queue_depth if background else self.interactive_queue_depth) == 0:
+            self._in_flight += 1
+            return Slot(self, 0.0, priority, background)
+
+        # Background requests are served last, so only interactive ones count as "ahead" of interactive ones
+        depth = self.queue_depth if background else self.interactive_queue_depth
+        if depth >= self.max_queue:
+            raise AdmissionRejected("queue_full", self.retry_after())
+        if timeout is not None and self.estimate_wait(depth) > timeout:
+            raise AdmissionRejected("deadline", self.retry_after())
+
+        seq = next(self._counter)
+        key = (background, priority, seq) if self.policy == POLICY_PRIORITY else (background, seq)
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (key, waiter))
+        # An interactive request may be admissible while background requests wait for a slot
+        self._wake_next()
+
+        try:
+            # The slot is counted as in-flight by _wake_next before the future resolves
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted in the same loop iteration the wait timed out
+                self._release(None)
+            raise AdmissionRejected("deadline", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We were granted a slot but the caller went away
+                self._release(None)
+            raise
+
+        return Slot(self, time.monotonic() - enqueued_at, priority, background)
+
+    def _release(self, slot: Optional[Slot]):
+        self._in_flight -= 1
+        if slot is not None:
+            held = time.monotonic() - slot.admitted_at
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * held
+        self._wake_next()
+
+    def _wake_next(self):
+        while self._queue and self._in_flight < self.max_in_flight:
+            key, waiter = self._queue[0]
+            if not waiter.done() and key[0] and self._in_flight >= self.background_limit:
+                # Only background requests are left; keep the reserved slots free
+                break
+            heapq.heappop(self._queue)
+            if waiter.done():
+                # Timed out or cancelled while queued
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
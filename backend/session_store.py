@@ -0,0 +1,219 @@
+import fcntl
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import config
+
+# ------------------------------------------------------------------------------
+# Conversation Sessions
+# ------------------------------------------------------------------------------
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Session:
+    """
+    Server-side conversation history.
+
+    Messages use the same dict format as the /chat endpoint ({"role", "content"}).
+    Assistant messages also carry the parsed "reasoning" text, which is kept for
+    clients but not sent back to the model (Harmony drops past analysis anyway),
+    and "truncated": true if the client disconnected before the reply finished.
+    Because the stored history renders to the same tokens every turn, vLLM's
+    prefix cache can reuse the KV state of earlier turns.
+    """
+
+    def __init__(self, session_id: str, reasoning_effort: str, messages: Optional[List[Dict]] = None,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None):
+        self.id = session_id
+        self.reasoning_effort = reasoning_effort
+        self.messages: List[Dict] = messages or []
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    @property
+    def size_bytes(self) -> int:
+        """Approximate memory used by the stored text."""
+        return sum(len(m.get("content") or "") + len(m.get("reasoning") or "") for m in self.messages)
+
+    def append(self, role: str, content: str, reasoning: Optional[str] = None, truncated: bool = False):
+        message = {"role": role, "content": content}
+        if reasoning:
+            message["reasoning"] = reasoning
+        if truncated:
+            message["truncated"] = True
+        self.messages.append(message)
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.id,
+            "reasoning_effort": self.reasoning_effort,
+            "messages": self.messages,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        return cls(
+            data["session_id"],
+            data["reasoning_effort"],
+            data.get("messages"),
+            data.get("created_at"),
+            data.get("updated_at"),
+        )
+
+
+class SessionStore:
+    """Base class for session storage backends."""
+
+    def __init__(self, ttl: float = config.SESSION_TTL):
+        self.ttl = ttl
+
+    def create(self, reasoning_effort: str, messages: Optional[List[Dict]] = None) -> Session:
+        session = Session(uuid.uuid4().hex, reasoning_effort, messages)
+        self.save(session)
+        return session
+
+    def _expired(self, session: Session) -> bool:
+        return self.ttl > 0 and time.time() - session.updated_at > self.ttl
+
+    def get(self, session_id: str) -> Optional[Session]:
+        raise NotImplementedError
+
+    def save(self, session: Session):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def append_turn(self, session_id: str, messages: List[Dict]) -> Optional[Session]:
+        """
+        Appends messages to the stored session (re-read first, so turns that finished
+        in the meantime are kept). Returns None if the session is gone.
+        """
+        session = self.get(session_id)
+        if session is None:
+            return None
+        for message in messages:
+            session.append(**message)
+        self.save(session)
+        return session
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process LRU store. Sessions expire after `ttl` seconds of inactivity,
+    and the least recently used ones are evicted once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, ttl: float = config.SESSION_TTL, max_bytes: int = config.SESSION_MAX_BYTES):
+        super().__init__(ttl)
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self._expired(session):
+            self.delete(session_id)
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def save(self, session: Session):
+        size = session.size_bytes
+        self._total_bytes += size - self._sizes.get(session.id, 0)
+        self._sizes[session.id] = size
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+
+        # Evict least recently used sessions (never the one just saved)
+        while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            self.delete(oldest)
+
+    def delete(self, session_id: str):
+        if self._sessions.pop(session_id, None) is not None:
+            self._total_bytes -= self._sizes.pop(session_id, 0)
+
+
+class DiskSessionStore(SessionStore):
+    """Stores each session as a JSON file in `directory`, so sessions survive restarts."""
+
+    def __init__(self, directory: str = config.SESSION_DIR, ttl: float = config.SESSION_TTL):
+        super().__init__(ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> Optional[str]:
+        # Session IDs are generated by us; reject anything else to avoid path traversal
+        if not _SESSION_ID_RE.match(session_id):
+            return None
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def get(self, session_id: str) -> Optional[Session]:
+        path = self._path(session_id)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                session = Session.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Failed to load session {session_id}: {e}")
+            return None
+        if self._expired(session):
+            self.delete(session_id)
+            return None
+        return session
+
+    def save(self, session: Session):
+        path = self._path(session.id)
+        # Write to a temp file first so a crash never leaves a truncated session
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    def delete(self, session_id: str):
+        path = self._path(session_id)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        if path is not None and os.path.exists(f"{path}.lock"):
+            os.remove(f"{path}.lock")
+
+    def append_turn(self, session_id: str, messages: List[Dict]) -> Optional[Session]:
+        """
+        Appends under an exclusive file lock, so concurrent turns on the same session
+        (possibly in different API workers) don't overwrite each other's replies.
+        """
+        path = self._path(session_id)
+        if path is None:
+            return None
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return super().append_turn(session_id, messages)
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store selected by config.SESSION_STORE."""
+    global _store
+    if _store is None:
+        if config.SESSION_STORE == "memory":
+            _store = MemorySessionStore()
+        elif config.SESSION_STORE == "disk":
+            _store = DiskSessionStore()
+        else:
+            raise ValueError(f"Unknown SESSION_STORE: {config.SESSION_STORE}")
+    return _store
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import config
+from engine_base import EngineBackend, EngineOutput, SamplingConfig
+
+# ------------------------------------------------------------------------------
+# Simulated Engine (CPU only)
+# ------------------------------------------------------------------------------
+
+# Filler vocabulary for generated text (ASCII so every token decodes on its own)
+_WORDS = (
+    "the model considers the question and weighs each option before it writes "
+    "a short clear answer for the user based on what it knows so far"
+).split()
+
+_ANALYSIS_HEADER = "<|channel|>analysis<|message|>"
+_FINAL_HEADER = "<|end|><|start|>assistant<|channel|>final<|message|>"
+_RETURN = "<|return|>"
+
+# Prefix cache simulation: prompts are hashed in blocks of this many tokens (like vLLM's KV blocks)
+_BLOCK_SIZE = 16
+_MAX_CACHED_BLOCKS = 100_000
+
+
+class SimulatedEngine(EngineBackend):
+    """
+    A CPU-only stand-in for the vLLM engine, used for load testing the API layer.
+
+    It emits Harmony-formatted token streams (an analysis message followed by a
+    final message) with configurable time-to-first-token, per-token latency,
+    batch-size-dependent slowdown and output length. The prompt is ignored,
+    except that a prompt ending with the final channel header continues with
+    the final message (a forced switch out of the analysis channel).
+    """
+
+    _initialized: bool = False
+    _active: int = 0
+    # Pre-decoded (token_id, text, is_special) tuples, built once at startup
+    _script: List[Tuple[int, str, bool]] = None
+    # Token IDs of the final channel header and the script index right after it
+    _final_header: Tuple[int, ...] = ()
+    _final_start: int = 0
+    # Chained hashes of prompt blocks seen so far (simulated prefix cache)
+    _blocks: "OrderedDict[int, None]" = None
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._initialized
+
+    def initialize(self):
+        if self._initialized:
+            return
+
+        print("🔄 Initializing Simulated Engine (no model is loaded)...")
+        reasoning = " ".join(_WORDS[i % len(_WORDS)] for i in range(config.SIM_REASONING_TOKENS))
+        answer = " ".join(_WORDS[-(i % len(_WORDS)) - 1] for i in range(config.SIM_OUTPUT_TOKENS))
+        text = f"{_ANALYSIS_HEADER}{reasoning}{_FINAL_HEADER}{answer}{_RETURN}"
+        enc = self._load_encoding()
+        self._script = self._tokenize(text, enc)
+        self._final_header = tuple(token_id for token_id, _, _ in self._tokenize(_FINAL_HEADER, enc))
+        self._final_start = len(self._tokenize(f"{_ANALYSIS_HEADER}{reasoning}{_FINAL_HEADER}", enc))
+        self._active = 0
+        self._blocks = OrderedDict()
+        self._initialized = True
+        print(f"✅ Simulated Engine ready ({len(self._script)} tokens per response).")
+
+    @staticmethod
+    def _load_encoding():
+        try:
+            import openai_harmony
+            return openai_harmony.load_harmony_encoding(openai_harmony.HarmonyEncodingName.HARMONY_GPT_OSS)
+        except Exception as e:
+            print(f"Warning: Harmony encoding unavailable for simulated engine, using pseudo tokens: {e}")
+            return None
+
+    @staticmethod
+    def _tokenize(text: str, enc) -> List[Tuple[int, str, bool]]:
+        """
+        Tokenizes the scripted response with the Harmony encoding so token IDs are real.
+        Falls back to word-level pseudo tokens if the encoding can't be loaded (e.g. offline).
+        """
+        if enc is not None:
+            tokens = enc.encode(text, allowed_special="all")
+            return [(t, enc.decode([t]), enc.is_special_token(t)) for t in tokens]
+
+        pieces = []
+        for part in text.replace("<|", "\0<|").replace("|>", "|>\0").split("\0"):
+            if part.startswith("<|"):
+                pieces.append((part, True))
+            else:
+                pieces.extend((w, False) for w in part.split(" ") if w)
+        script = []
+        for i, (piece, special) in enumerate(pieces):
+            # Re-insert the spaces between consecutive words
+            if not special and i > 0 and not pieces[i - 1][1]:
+                piece = " " + piece
+            script.append((200000 + i if special else i, piece, special))
+        return script
+
+    def _match_prefix(self, prompt: Union[str, List[int]]) -> Tuple[int, int]:
+        """
+        Returns (prompt_tokens, cached_tokens), simulating vLLM's automatic prefix caching:
+        full blocks of the prompt are hashed (chained), and leading blocks seen before are hits.
+        """
+        if not isinstance(prompt, list):
+            return len(prompt) // 4, 0
+
+        cached = 0
+        matching = config.ENABLE_PREFIX_CACHING
+        h = 0
+        for start in range(0, len(prompt) - _BLOCK_SIZE + 1, _BLOCK_SIZE):
+            h = hash((h, tuple(prompt[start:start + _BLOCK_SIZE])))
+            if matching and h in self._blocks:
+                self._blocks.move_to_end(h)
+                cached += _BLOCK_SIZE
+                continue
+            matching = False
+            self._blocks[h] = None
+        while len(self._blocks) > _MAX_CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return len(prompt), cached
+
+    def _token_latency(self) -> float:
+        """Per-token latency, growing with the number of concurrently decoding sequences."""
+        return config.SIM_TOKEN_LATENCY * (1 + config.SIM_BATCH_SLOWDOWN * max(0, self._active - 1))
+
+    async def _generate(self, prompt: Union[str, List[int]], sampling: SamplingConfig, request_id: str, affinity_key: Optional[str] = None, priority: int = 0, background: bool = False) -> AsyncIterator[EngineOutput]:
+        script = self._script
+        # Like vLLM, the terminal stop token is not part of the output
+        if script and script[-1][2]:
+            script = script[:-1]
+        start = 0
+        header = self._final_header
+        if isinstance(prompt, list) and header and tuple(prompt[-len(header):]) == header:
+            start = self._final_start
+        for i in range(start, len(script)):
+            if script[i][0] in sampling.stop_token_ids:
+                # Stop tokens end the sequence and are not part of the output
+                script = script[:i]
+                break
+        script = script[start:]
+        limit = min(len(script), sampling.max_tokens)
+        prompt_tokens, cached_tokens = self._match_prefix(prompt)
+        # Samples decode in lockstep; each gets its own made-up per-token log probability
+        samples = range(sampling.n)
+        token_logprobs = [-0.2 - (hash((request_id, index)) % 100) / 200 for index in samples] if sampling.logprobs is not None else None
+
+        self._active += sampling.n
+        try:
+            await asyncio.sleep(config.SIM_TTFT)
+            next_time = time.monotonic()
+            for i in range(limit):
+                if i > 0:
+                    # Sleep until the next scheduled token time (absorbs our own overhead)
+                    next_time += self._token_latency()
+                    await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+
+                token_id, piece, special = script[i]
+                text = "" if (special and sampling.skip_special_tokens) or not sampling.detokenize else piece
+                finish_reason: Optional[str] = None
+                if i == limit - 1:
+                    finish_reason = "length" if limit < len(script) else "stop"
+                for index in samples:
+                    output = EngineOutput(text=text, token_ids=[token_id], finish_reason=finish_reason, index=index)
+                    if token_logprobs is not None:
+                        output.cumulative_logprob = token_logprobs[index] * (i + 1)
+                    if i == 0 and index == 0:
+                        output.prompt_tokens = prompt_tokens
+                        output.cached_tokens = cached_tokens
+                    yield output
+        finally:
+            self._active -= sampling.n
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+import config
+from engine_base import EngineBackend, get_engine
+
+# ------------------------------------------------------------------------------
+# Startup: Background Loading, Warm-Up and Readiness
+# ------------------------------------------------------------------------------
+
+STATE_LOADING = "loading"   # Loading the Harmony encoding and the engine
+STATE_WARMING = "warming"   # Running warm-up requests
+STATE_READY = "ready"       # Serving requests
+STATE_FAILED = "failed"     # Startup failed (see `error`); the process should be restarted
+
+# Representative chat sent once per reasoning effort before the server reports ready
+WARMUP_MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant. Answer clearly and concisely."},
+    {"role": "user", "content": "Explain why the sky is blue, then give one everyday example of the same effect."},
+]
+
+# Set when this module is first imported (main.py imports it before anything heavy)
+_PROCESS_START = time.monotonic()
+
+
+class Startup:
+    """
+    Loads the engine in the background so the API answers liveness probes (and
+    reports progress) while the model loads, then warms it up with a short chat
+    at each reasoning effort, so the first real users don't pay for compilation
+    and first-use allocations. Generation endpoints return 503 until `ready`.
+
+    Each phase is timed; `report()` shows where cold-start time went.
+    """
+
+    def __init__(self):
+        self.state = STATE_LOADING
+        self.error: Optional[str] = None
+        # The engine, once its backend module is imported and it is initialized
+        self.engine: Optional[EngineBackend] = None
+        # Phase name -> seconds (finished phases) and phase name -> start time (running ones)
+        self.timings: Dict[str, float] = {}
+        self._running: Dict[str, float] = {}
+        self.warmup_total = 0
+        self.warmup_done = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == STATE_READY
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times one startup phase."""
+        started = time.monotonic()
+        self._running[name] = started
+        try:
+            yield
+        finally:
+            del self._running[name]
+            self.timings[name] = time.monotonic() - started
+            print(f"ℹ️  Startup phase '{name}' took {self.timings[name]:.2f}s")
+
+    def report(self) -> dict:
+        """Startup state, phase timings and warm-up progress (for the health endpoints)."""
+        now = time.monotonic()
+        report = {
+            "status": self.state,
+            "uptime_s": round(now - _PROCESS_START, 3),
+            "phases_s": {name: round(seconds, 3) for name, seconds in self.timings.items()},
+            "running": {name: round(now - started, 3) for name, started in self._running.items()},
+        }
+        if self.warmup_total:
+            report["warmup"] = {"done": self.warmup_done, "total": self.warmup_total}
+        if self.error is not None:
+            report["error"] = self.error
+        return report
+
+    def start(self):
+        """Starts loading in the background (returns immediately)."""
+        self.timings["imports"] = time.monotonic() - _PROCESS_START
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def wait(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def run(self):
+        """Loads and warms up the engine; failures are recorded rather than raised."""
+        try:
+            # Blocking loads run in threads, so the event loop keeps answering probes
+            await asyncio.gather(self._load_harmony(), self._load_engine())
+            if config.WARMUP_ENABLED:
+                self.state = STATE_WARMING
+                with self.phase("warmup"):
+                    await self._warm_up()
+            self.timings["total"] = time.monotonic() - _PROCESS_START
+            self.state = STATE_READY
+            print(f"✅ Ready to serve after {self.timings['total']:.2f}s")
+        except Exception as e:
+            self.state = STATE_FAILED
+            self.error = str(e)
+            print(f"⚠️  Startup failed: {e}")
+
+    async def _load_harmony(self):
+        from routers import chat
+        with self.phase("harmony"):
+            encoding = await asyncio.to_thread(chat.load_harmony)
+        if encoding is None:
+            # /chat, /sessions and chat batch items can't run without it, so the server isn't ready
+            raise RuntimeError(f"Harmony encoding unavailable: {chat.harmony_error}")
+
+    async def _load_engine(self):
+        # Importing the backend (e.g. vLLM) is a phase of its own
+        with self.phase("engine_import"):
+            engine = await asyncio.to_thread(get_engine)
+        with self.phase("engine_load"):
+            await asyncio.to_thread(engine.initialize)
+        self.engine = engine
+
+    async def _warm_up(self):
+        """
+        Sends the warm-up chat once per reasoning effort in WARMUP_EFFORTS, through
+        the same rendering, engine and Harmony parsing path as /chat. With an
+        engine pool the requests run concurrently, ENGINE_REPLICAS per effort, so
+        the router spreads them over the replicas.
+        """
+        from harmony_stream import HarmonyControl
+        from routers import chat
+        efforts = [chat.parse_reasoning_effort(name) for name in config.WARMUP_EFFORTS.split(",") if name.strip()]
+        copies = max(1, config.ENGINE_REPLICAS)
+        self.warmup_total = len(efforts) * copies
+
+        async def run_one(effort):
+            fitted = chat.budgeter.fit(chat.with_system_message(WARMUP_MESSAGES), effort, reserve_tokens=config.WARMUP_MAX_TOKENS)
+            outputs = self.engine.generate(
+                fitted.token_ids,
+                control=HarmonyControl(chat.enc),
+                max_tokens=config.WARMUP_MAX_TOKENS,
+                detokenize=False,
+                stop_token_ids=chat.STOP_TOKEN_IDS,
+            )
+            async for _ in chat.filter_harmony_stream(outputs):
+                pass
+            self.warmup_done += 1
+
+        for effort in efforts:
+            with self.phase(f"warmup_{effort.value.lower()}"):
+                await asyncio.gather(*(run_one(effort) for _ in range(copies)))
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.engine is not None:
+            self.engine.shutdown()
+
+
+startup = Startup()
@@ -5,6 +5,20 @@ export const useChat = (mode: Mode) => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const abortControllerRef = useRef<AbortController | null>(null);
+  // Server-side session for chat mode: only the new message is uploaded each turn
+  const sessionIdRef = useRef<string | null>(null);
+
+  const createSession = async (history: { role: string; content: string }[]) => {
+    const res = await fetch('http://localhost:8000/sessions', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ messages: history }),
+    });
+    if (!res.ok) throw new Error('Failed to create session');
+    const data = await res.json();
+    sessionIdRef.current = data.session_id;
+    return data.session_id as string;
+  };
 
   const sendMessage = useCallback(async (text: string) => {
     if (!text.trim() || isLoading) return;
@@ -19,48 +33,49 @@ export const useChat = (mode: Mode) => {
     abortControllerRef.current = new AbortController();
 
     try {
-      const endpoint = mode === 'chat' 
-        ? 'http://localhost:8000/chat' 
-        : 'http://localhost:8000/completion';
-      
-      let payload;
+      let response: Response;
       if (mode === 'chat') {
-        // Construct messages list for chat mode
-        // Note: We include previous history for context
-        // This effectively rebuilds the conversation history for every request
-        // since the backend is stateless
+        // Append only the new message to the server-side session.
+        // If the session expired, recreate it from the local history and retry once.
+        const send = (sessionId: string) => fetch(`http://localhost:8000/sessions/${sessionId}/messages`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ content: text }),
+          signal: abortControllerRef.current!.signal,
+        });
         const history = messages.map(m => ({
           role: m.sender === 'user' ? 'user' : 'assistant',
           content: m.text
         }));
-        history.push({ role: 'user', content: text });
-        
-        payload = { messages: history };
+
+        response = await send(sessionIdRef.current ?? await createSession(history));
+        if (response.status === 404) {
+          response = await send(await createSession(history));
+        }
       } else {
         // Completion mode just sends the raw prompt
-        payload = { prompt: text };
+        response = await fetch('http://localhost:8000/completion', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ prompt: text }),
+          signal: abortControllerRef.current.signal,
+        });
       }
 
-      const response = await fetch(endpoint, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(payload),
-        signal: abortControllerRef.current.signal,
-      });
-
       if (!response.body) throw new Error('No response body');
       
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let accumulatedText = '';
       let accumulatedReasoning = '';
+      // A read can end in the middle of a line; the partial line waits for the next read
+      let buffered = '';
 
       while (true) {
         const { value, done } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value, { stream: true });
-        const lines = chunk.split('\n');
+        buffered += done ? decoder.decode() : decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = done ? '' : lines.pop() ?? '';
 
         for (const line of lines) {
           if (!line.trim()) continue;
@@ -71,8 +86,11 @@ export const useChat = (mode: Mode) => {
 
             if (type === 'reasoning') {
                 accumulatedReasoning += chunkText;
-            } else {
+            } else if (type === 'content') {
                 accumulatedText += chunkText;
+            } else {
+                // Commentary / tool call events are not rendered
+                continue;
             }
 
             setMessages(prev => prev.map(msg => 
@@ -80,6 +98,7 @@ export const useChat = (mode: Mode) => {
             ));
           } catch (e) { console.error('Parse error', e); }
         }
+        if (done) break;
       }
     } catch (error: any) {
       if (error.name !== 'AbortError') {
@@ -97,7 +116,13 @@ export const useChat = (mode: Mode) => {
     setIsLoading(false);
   }, []);
 
-  const clearHistory = useCallback(() => setMessages([]), []);
+  const clearHistory = useCallback(() => {
+    setMessages([]);
+    if (sessionIdRef.current) {
+      fetch(`http://localhost:8000/sessions/${sessionIdRef.current}`, { method: 'DELETE' }).catch(() => {});
+      sessionIdRef.current = null;
+    }
+  }, []);
 
   return { messages, isLoading, sendMessage, stopGeneration, clearHistory };
 };
\ No newline at end of file